@@ -24,9 +24,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-96#@)d$h$%)h(-@2)v%)=u65x%nhd7!3zx7#1@u)-x8a3_5f-i"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "").split(",") if host
+]
 
 
 # Application definition
@@ -51,6 +53,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "main.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -92,10 +95,31 @@ DATABASES = {
         "PASSWORD": "POSTGRES_PASSWORD",
         "HOST": "db",
         "PORT": 5432,
+        # Persistent connections are also reused by "parallel" map backend and ASGI threads
+        "CONN_MAX_AGE": int(os.environ.get("DJANGO_CONN_MAX_AGE", 0)),
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Use shared backend (Redis, Memcached) to share clusters and hit/miss counters between workers
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "map_clusters": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "map_clusters",
+        "TIMEOUT": 60 * 10,
+        "OPTIONS": {
+            "MAX_ENTRIES": 1000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -144,6 +168,9 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 100,
 }
 
+# Estimated count pagination uses exact count below this rows count
+PAGINATION_EXACT_COUNT_THRESHOLD = 10000
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "CLUSTERING EXAMPLE API",
     "DESCRIPTION": """API for clustering example.""",
@@ -153,6 +180,47 @@ SPECTACULAR_SETTINGS = {
 
 MAP_MAX_OBJECTS_IN_LINE = 8
 MAP_GRID_CELL_COUNT = 500
+# Estimated vehicles count limits for "map_auto" clustering strategies:
+# raw points, DBSCAN and grid + DBSCAN above "dbscan" limit
+MAP_AUTO_STRATEGY_THRESHOLDS = {
+    "points": 500,
+    "dbscan": 20000,
+}
+# "postgis" clusters in the database, "numpy" clusters in the web worker,
+# "parallel" aggregates partitions concurrently and clusters merged cells in the web worker
+MAP_CLUSTERING_BACKEND = "postgis"
+# Database connections used by "parallel" backend for one request
+MAP_PARALLEL_WORKERS = 4
+# Zoom levels precomputed by "build_cluster_pyramid" command
+MAP_PYRAMID_ZOOM_LEVELS = list(range(6, 19))
+# Tiles above this zoom are rejected, cluster distance is too small for them
+MAP_TILE_MAX_ZOOM = 22
+MAP_TILE_EXTENT = 4096
+MAP_TILE_BUFFER = 64
+MAP_TILE_MAX_AGE = 60 * 60
+# Snapped viewport grid step is the zoom level tile size divided by this value
+MAP_SNAP_SUBDIVISIONS = 4
+MAP_CLUSTER_CACHE_ALIAS = "map_clusters"
+# Rows fetched from server-side cursor per chunk for streamed responses
+MAP_STREAM_CHUNK_SIZE = 2000
+# Viewports clusterized by one "map_batch" request
+MAP_BATCH_MAX_VIEWPORTS = 20
+# Estimated vehicles count limits for map clustering queries: DBSCAN is replaced
+# with grid + DBSCAN above "grid" limit, requests above "reject" limit fail with a hint
+MAP_COST_GUARD_THRESHOLDS = {
+    "grid": 200000,
+    "reject": 20000000,
+}
+# Time limit for one map clustering query, milliseconds
+MAP_STATEMENT_TIMEOUT = 30000
+# Rounding digits limit for cluster coordinates, default precision follows grid cell size
+MAP_MAX_COORDINATES_PRECISION = 10
+# Threads with own database connections for every ASGI worker process
+ASYNC_DATABASE_THREADS = 20
+# Responses for these paths are compressed when they aren't smaller than COMPRESSION_MIN_SIZE bytes
+COMPRESSION_PATH_PREFIXES = ["/api/"]
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
 
 if DEBUG:
     INSTALLED_APPS += ["silk"]
@@ -221,6 +289,10 @@ LOGGING = {
             "level": "DEBUG",
             "handlers": ["db_file", "console"],
         },
+        "main": {
+            "handlers": ["file", "console"],
+            "level": "DEBUG" if DEBUG else "INFO",
+        },
     },
 }
 PARTITIONS_EXTRA_COUNT = 10
@@ -24,11 +24,17 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from main import async_views
 from main.views import (
     VehicleListView,
+    VehicleMapAutoListView,
+    VehicleMapBatchView,
+    VehicleMapGeohashListView,
     VehicleMapLargeCountListView,
     VehicleMapListView,
+    VehicleMapPyramidListView,
     VehicleNotPaginatedListView,
+    VehicleTileView,
 )
 
 urlpatterns = [
@@ -49,6 +55,42 @@ urlpatterns = [
         "api/vehicles/map_fast/",
         VehicleMapLargeCountListView.as_view(),
     ),
+    path(
+        "api/vehicles/map_auto/",
+        VehicleMapAutoListView.as_view(),
+    ),
+    path(
+        "api/vehicles/map_geohash/",
+        VehicleMapGeohashListView.as_view(),
+    ),
+    path(
+        "api/vehicles/map_batch/",
+        VehicleMapBatchView.as_view(),
+    ),
+    path(
+        "api/vehicles/map_pyramid/",
+        VehicleMapPyramidListView.as_view(),
+    ),
+    path(
+        "api/vehicles/tiles/<int:z>/<int:x>/<int:y>.mvt",
+        VehicleTileView.as_view(),
+    ),
+    path(
+        "api/async/vehicles/",
+        async_views.vehicle_list_view,
+    ),
+    path(
+        "api/async/vehicles/map/",
+        async_views.vehicle_map_view,
+    ),
+    path(
+        "api/async/vehicles/map_fast/",
+        async_views.vehicle_map_fast_view,
+    ),
+    path(
+        "api/async/vehicles/map_pyramid/",
+        async_views.vehicle_map_pyramid_view,
+    ),
     path(
         "api/doc/schema/",
         SpectacularAPIView.as_view(),
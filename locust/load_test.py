@@ -684,6 +684,14 @@ class WebsiteUser(FastHttpUser):
             f"/api/vehicles/map_fast/?{filter_str}",
         )
 
+    @tag("cached")
+    @task
+    def cached_map(self):
+        filter_str = self.get_filter()
+        self.client.get(
+            f"/api/vehicles/map_fast/?snap=1&{filter_str}",
+        )
+
 
 def main(tags):
     global env
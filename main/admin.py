@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from main.models import Vehicle
+from main.models import ImportCheckpoint, Vehicle
 
 
 @admin.register(Vehicle)
@@ -19,3 +19,17 @@ class VehicleAdmin(admin.ModelAdmin):
         "status",
         "vehicle_make",
     ]
+
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = [
+        "file_path",
+        "status",
+        "rows_processed",
+        "rows_merged",
+        "updated_at",
+    ]
+    list_filter = [
+        "status",
+    ]
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from asgiref.sync import sync_to_async
+
+from main.views import (
+    VehicleListView,
+    VehicleMapLargeCountListView,
+    VehicleMapListView,
+    VehicleMapPyramidListView,
+)
+
+# Separate pool, so slow map queries don't block the event loop
+# and don't share single thread with thread sensitive code
+database_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DATABASE_THREADS,
+    thread_name_prefix="database",
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    """Run sync view and render the response in the database thread."""
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, "render") and callable(response.render):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view_class, **initkwargs):
+    """Wrap sync DRF view into async view with thread offload for database access."""
+    view = view_class.as_view(**initkwargs)
+    run_in_thread = sync_to_async(
+        run_view,
+        thread_sensitive=False,
+        executor=database_executor,
+    )
+
+    async def wrapper(request, *args, **kwargs):
+        return await run_in_thread(view, request, *args, **kwargs)
+
+    # DRF views are csrf exempt
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+vehicle_list_view = async_view(VehicleListView)
+vehicle_map_view = async_view(VehicleMapListView)
+vehicle_map_fast_view = async_view(VehicleMapLargeCountListView)
+vehicle_map_pyramid_view = async_view(VehicleMapPyramidListView)
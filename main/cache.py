@@ -0,0 +1,91 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils.http import quote_etag
+
+from main.models import DataVersion, StatsCounter
+
+CACHE_HITS_KEY = "map-clusters:hits"
+CACHE_MISSES_KEY = "map-clusters:misses"
+COMPRESSED_RESPONSES_KEY = "compression:responses"
+COMPRESSION_BYTES_SAVED_KEY = "compression:bytes-saved"
+
+
+def get_data_version():
+    """Get token which changes after every write to the vehicles and the cluster pyramid.
+
+    Versions are set by database triggers, so writes with raw SQL and COPY are also counted.
+    """
+    return ",".join(
+        f"{name}:{version}"
+        for name, version in DataVersion.objects.order_by("name").values_list(
+            "name", "version"
+        )
+    )
+
+
+def get_data_etag(prefix, params):
+    """Get ETag for the data version and request params."""
+    data_version = get_data_version()
+    etag = hashlib.md5(
+        json.dumps([prefix, data_version, params], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return quote_etag(etag)
+
+
+def get_map_cache():
+    return caches[settings.MAP_CLUSTER_CACHE_ALIAS]
+
+
+def get_cache_key(prefix, params):
+    params_hash = hashlib.md5(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"map-clusters:{prefix}:{get_data_version()}:{params_hash}"
+
+
+def increment_counter(key, delta=1):
+    """Add delta to the counter in the database.
+
+    Cache is local for every server process, so counters are kept in the database
+    to be shared by all workers and read by management commands.
+    """
+    SQL_INCREMENT_COUNTER = """
+        INSERT INTO {table_name} (name, value) VALUES (%(name)s, %(delta)s)
+        ON CONFLICT (name) DO UPDATE SET value = {table_name}.value + EXCLUDED.value
+    """
+    table_name = StatsCounter._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SQL_INCREMENT_COUNTER.format(table_name=table_name),
+            {"name": key, "delta": delta},
+        )
+
+
+def get_counters(*keys):
+    """Get counters values, missing counters are 0."""
+    values = dict(
+        StatsCounter.objects.filter(name__in=keys).values_list("name", "value")
+    )
+    return [values.get(key, 0) for key in keys]
+
+
+def get_cache_stats():
+    hits, misses = get_counters(CACHE_HITS_KEY, CACHE_MISSES_KEY)
+    return {
+        "hits": hits,
+        "misses": misses,
+    }
+
+
+def get_compression_stats():
+    responses, bytes_saved = get_counters(
+        COMPRESSED_RESPONSES_KEY, COMPRESSION_BYTES_SAVED_KEY
+    )
+    return {
+        "responses": responses,
+        "bytes_saved": bytes_saved,
+    }
@@ -0,0 +1,55 @@
+import numpy as np
+
+# Neighbour cells offsets. Opposite directions are covered by edges symmetry
+NEIGHBOUR_OFFSETS = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+
+def grid_clusters(lon, lat, eps):
+    """Vectorized DBSCAN-like clustering with min points = 1.
+
+    Points are hashed to the grid with eps cell size, so points closer than eps
+    are always in the same or in neighbour cells. Connected non-empty cells
+    make one cluster. Clusters can be a bit larger than in ST_ClusterDBScan,
+    because points in neighbour cells can be up to 2 * sqrt(2) * eps away.
+
+    Returns cluster label (0..clusters count - 1) for every point.
+    """
+    if not eps > 0:
+        raise ValueError(f"eps must be positive, got {eps}")
+    if not len(lon):
+        return np.empty(0, dtype=np.int64)
+
+    cell_x = np.floor(lon / eps).astype(np.int64)
+    cell_y = np.floor(lat / eps).astype(np.int64)
+    cell_x -= cell_x.min()
+    cell_y -= cell_y.min() - 1
+    # Reserve empty row around cells, so neighbour keys don't wrap to the next column
+    height = cell_y.max() + 2
+    keys, point_cells = np.unique(cell_x * height + cell_y, return_inverse=True)
+
+    # Edges between non-empty neighbour cells
+    edges_from = []
+    edges_to = []
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        neighbour_keys = keys + dx * height + dy
+        positions = np.searchsorted(keys, neighbour_keys)
+        positions = np.minimum(positions, len(keys) - 1)
+        found = keys[positions] == neighbour_keys
+        edges_from.append(np.flatnonzero(found))
+        edges_to.append(positions[found])
+    edges_from = np.concatenate(edges_from)
+    edges_to = np.concatenate(edges_to)
+
+    # Connected components with minimal label propagation and pointer jumping
+    labels = np.arange(len(keys))
+    while True:
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, edges_from, labels[edges_to])
+        np.minimum.at(new_labels, edges_to, labels[edges_from])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    _, point_labels = np.unique(labels[point_cells], return_inverse=True)
+    return point_labels
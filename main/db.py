@@ -0,0 +1,77 @@
+import json
+
+from django.db import connection
+
+from main.models import Vehicle
+
+
+def get_partitions_reltuples(table_name):
+    """Get planner rows count for the table with all its partitions."""
+    query = """
+        SELECT COALESCE(sum(GREATEST(reltuples, 0)), 0)
+        FROM pg_class
+        WHERE oid = %(table_name)s::regclass
+            OR oid IN (
+                SELECT inhrelid FROM pg_inherits WHERE inhparent = %(table_name)s::regclass
+            )
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, {"table_name": table_name})
+        return int(cursor.fetchone()[0])
+
+
+def explain_rows(queryset):
+    """Get planner rows estimate for the queryset without running it."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimate_vehicles_count(queryset):
+    """Planner estimate for vehicles queryset count.
+
+    Statistics for partitions are used for unfiltered queryset, EXPLAIN for filtered.
+    """
+    if not queryset.query.where:
+        return get_partitions_reltuples(Vehicle._meta.db_table)
+    return explain_rows(queryset)
+
+
+def get_partition_ranges(model):
+    """Get [start, end) partition key ranges which contain model rows.
+
+    Ranges follow "custom_partitioned" size, so every range is one partition.
+    """
+    column = model.custom_partitioned["column"]
+    size = model.custom_partitioned["size"]
+    query = f"SELECT MIN({column}), MAX({column}) FROM {model._meta.db_table}"
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        min_value, max_value = cursor.fetchone()
+    if min_value is None:
+        return []
+    return [
+        (start, start + size)
+        for start in range(min_value // size * size, max_value + 1, size)
+    ]
+
+
+def explain_analyze(sql, params):
+    """Run the query with EXPLAIN (ANALYZE, BUFFERS) and return the root plan node."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def iter_plan_nodes(plan):
+    """Walk through the plan node and all its children."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from iter_plan_nodes(child)
@@ -1,4 +1,4 @@
-from django.contrib.gis.geos import Polygon
+from django.db.models.functions import Trim, Upper
 
 from django_filters import rest_framework as filters
 
@@ -6,12 +6,29 @@ from main.models import Vehicle
 
 
 class VehicleFilter(filters.FilterSet):
+    vehicle_make__icontains = filters.CharFilter(method="filter_make_icontains")
+    vehicle_make_normalized = filters.CharFilter(method="filter_make_normalized")
+
     class Meta:
         model = Vehicle
         fields = {
             "creation_date": ["lt", "gt", "exact"],
             "completion_date": ["lt", "gt", "exact"],
-            "vehicle_make": ["icontains"],
             "vehicle_color": ["exact"],
             "status": ["exact"],
         }
+
+    def filter_make_icontains(self, queryset, name, value):
+        """Compare with the expression of trigram index "main_vehicle_make_trgm".
+
+        Value is uppercased here, so the pattern is always a constant for the planner.
+        """
+        return queryset.alias(vehicle_make_upper=Upper("vehicle_make")).filter(
+            vehicle_make_upper__contains=value.upper()
+        )
+
+    def filter_make_normalized(self, queryset, name, value):
+        """Case and spaces insensitive exact make, served by "main_vehicle_make_normalized" index."""
+        return queryset.alias(
+            vehicle_make_normalized=Upper(Trim("vehicle_make"))
+        ).filter(vehicle_make_normalized=value.strip().upper())
@@ -0,0 +1,15 @@
+from django.db.models import FloatField, Func
+
+
+class X(Func):
+    """Longitude of the point."""
+
+    function = "ST_X"
+    output_field = FloatField()
+
+
+class Y(Func):
+    """Latitude of the point."""
+
+    function = "ST_Y"
+    output_field = FloatField()
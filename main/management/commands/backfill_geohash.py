@@ -0,0 +1,43 @@
+from django.core.management import BaseCommand
+from django.db import connection
+from django.db.models import Max
+
+from main.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = "Fill geohash for vehicles created before geohash trigger."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Vehicles id range updated in one transaction",
+        )
+
+    def handle(self, *args, **options):
+        SQL_FILL_GEOHASH = """
+            UPDATE {table_name}
+            SET geohash = ST_GeoHash(location, 12)
+            WHERE id >= %(min_id)s AND id < %(max_id)s
+                AND location IS NOT NULL
+                AND geohash IS NULL
+        """
+
+        batch_size = options["batch_size"]
+        last_id = Vehicle.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        updated = 0
+        # Small id ranges keep every update inside one partition and short lock time
+        for min_id in range(0, last_id + 1, batch_size):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    SQL_FILL_GEOHASH.format(table_name=Vehicle._meta.db_table),
+                    {"min_id": min_id, "max_id": min_id + batch_size},
+                )
+                updated += cursor.rowcount
+            print(
+                f"\rUpdated {updated} vehicles, id {min_id + batch_size} of {last_id}",
+                end="",
+            )
+        print()
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from main.models import Vehicle, VehicleClusterCell
+
+
+class Command(BaseCommand):
+    help = "Precompute grid cell aggregates for the map cluster pyramid."
+
+    def handle(self, *args, **options):
+        # Aggregate every vehicle into the grid cell for the zoom level.
+        # Single vehicle attributes are saved only for cells with one item
+        SQL_BUILD_LEVEL = """
+            INSERT INTO {cell_table} (
+                zoom,
+                cell_x,
+                cell_y,
+                vehicle_color,
+                vehicles_count,
+                lon_sum,
+                lat_sum,
+                vehicle_make,
+                creation_date,
+                completion_date,
+                type_of_service_request
+            )
+            SELECT %(zoom)s,
+                floor(ST_X(location) / %(cell_size)s)::integer AS cell_x,
+                floor(ST_Y(location) / %(cell_size)s)::integer AS cell_y,
+                vehicle_color,
+                count(*),
+                sum(ST_X(location)),
+                sum(ST_Y(location)),
+                CASE WHEN count(*) = 1 THEN max(vehicle_make) END,
+                CASE WHEN count(*) = 1 THEN max(creation_date) END,
+                CASE WHEN count(*) = 1 THEN max(completion_date) END,
+                CASE WHEN count(*) = 1 THEN max(type_of_service_request) END
+            FROM {vehicle_table}
+            WHERE location IS NOT NULL
+            GROUP BY cell_x, cell_y, vehicle_color
+        """
+
+        # Rebuild in one transaction, so map keeps using old pyramid until commit
+        with transaction.atomic():
+            VehicleClusterCell.objects.all().delete()
+            with connection.cursor() as cursor:
+                for zoom in settings.MAP_PYRAMID_ZOOM_LEVELS:
+                    cursor.execute(
+                        SQL_BUILD_LEVEL.format(
+                            cell_table=VehicleClusterCell._meta.db_table,
+                            vehicle_table=Vehicle._meta.db_table,
+                        ),
+                        {
+                            "zoom": zoom,
+                            "cell_size": VehicleClusterCell.get_cell_size(zoom),
+                        },
+                    )
+                    print(f"Zoom {zoom}: {cursor.rowcount} cells created")
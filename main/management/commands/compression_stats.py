@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from main.cache import get_compression_stats
+
+
+class Command(BaseCommand):
+    help = "Show compressed API responses count and bytes saved."
+
+    def handle(self, *args, **options):
+        stats = get_compression_stats()
+        average = stats["bytes_saved"] / stats["responses"] if stats["responses"] else 0
+        print(f"Compressed responses: {stats['responses']}")
+        print(f"Bytes saved: {stats['bytes_saved']}")
+        print(f"Average bytes saved per response: {average:.0f}")
@@ -7,6 +7,14 @@ from django.db import connection
 class Command(BaseCommand):
     help = "New partition generation on cron."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-value",
+            type=int,
+            default=0,
+            help="Partition key value which will be inserted, for ids reserved before load",
+        )
+
     def handle(self, *args, **options):
         # Get the last partition key value.
         SQL_LAST_VALUE = "SELECT MAX ({column}) from {table_name}"
@@ -36,7 +44,7 @@ class Command(BaseCommand):
                             column=custom_partitioned["column"],
                         )
                     )
-                    last_value = cursor.fetchone()[0] or 0
+                    last_value = max(cursor.fetchone()[0] or 0, options["max_value"])
 
                     # Get partition key range for parttitions that should exist
                     partition_size = custom_partitioned["size"]
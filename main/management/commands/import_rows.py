@@ -1,72 +1,540 @@
+import csv
+import hashlib
+import io
+import multiprocessing
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from django.contrib.gis.geos import Point
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, connections, transaction
 
 import httpx
-import numpy as np
 import pandas as pd
 
-from main.models import Vehicle
-
+from main.models import ImportCheckpoint, Vehicle
 
 EXAMPLE_FILE_PATH = "files/example.csv"
 EXAMPLE_FILE_URL = (
     "https://data.cityofchicago.org/api/views/3c9v-pnva/rows.csv?accessType=DOWNLOAD"
 )
+# CSV columns with vehicle fields for them
+CSV_COLUMNS = {
+    "Creation Date": "creation_date",
+    "Status": "status",
+    "Completion Date": "completion_date",
+    "Service Request Number": "service_request_number",
+    "Type of Service Request": "type_of_service_request",
+    "License Plate": "license_plate",
+    "Vehicle Make/Model": "vehicle_make",
+    "Vehicle Color": "vehicle_color",
+    "Current Activity": "current_activity",
+    "Most Recent Action": "most_recent_action",
+    "How Many Days Has the Vehicle Been Reported as Parked?": "days_parked",
+    "Street Address": "street_address",
+    "ZIP Code": "zip_code",
+    "X Coordinate": "x_coordinate",
+    "Y Coordinate": "y_coordinate",
+    "Ward": "ward",
+    "Police District": "police_district",
+    "Community Area": "community_area",
+    "SSA": "ssa",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+}
+DATE_FIELDS = ["creation_date", "completion_date"]
+# Integer fields are read as floats by pandas when the column has empty values
+INTEGER_FIELDS = [
+    "days_parked",
+    "ward",
+    "police_district",
+    "community_area",
+    "ssa",
+]
+NUMBER_FIELDS = INTEGER_FIELDS + [
+    "x_coordinate",
+    "y_coordinate",
+    "latitude",
+    "longitude",
+]
+# Other columns are read as strings, so types don't depend on values in the chunk
+CSV_DTYPES = {
+    column: str for column, field in CSV_COLUMNS.items() if field not in NUMBER_FIELDS
+}
+CSV_DTYPES["Location"] = str
+
+# Bytes read at once when rows are counted or file is hashed
+COUNT_BLOCK_SIZE = 16 * 1024 * 1024
+STAGING_TABLE = "vehicle_import_staging"
+
+
+class FileRange(io.RawIOBase):
+    """Read only [start, end) bytes of the file."""
+
+    def __init__(self, path, start, end):
+        self.file = open(path, "rb")
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        read_size = self.file.readinto(memoryview(buffer)[:size])
+        self.remaining -= read_size
+        return read_size
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def read_csv_chunks(file, batch_size, names=None, skiprows=None):
+    """Read CSV by chunks, column names are passed for files without header."""
+    return pd.read_csv(
+        file,
+        header=None if names else "infer",
+        names=names,
+        usecols=list(CSV_COLUMNS) + ["Location"],
+        dtype=CSV_DTYPES,
+        chunksize=batch_size,
+        skiprows=skiprows,
+    )
+
+
+def import_file_range(path, names, start, end, first_id, batch_size):
+    """Load CSV rows from the bytes range with ids from first_id.
+
+    Runs in the worker process with its own database connection.
+    """
+    try:
+        with io.BufferedReader(FileRange(path, start, end)) as file_range:
+            chunks = read_csv_chunks(file_range, batch_size, names=names)
+            return Command().bulk_import(chunks, first_id=first_id, report=False)
+    finally:
+        connection.close()
 
 
 class Command(BaseCommand):
-    def parse_date(self, dt):
-        if dt:
-            return datetime.strptime(dt, "%m/%d/%Y")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Load rows with COPY instead of get_or_create for every row",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Rows read from CSV and loaded to the database at once",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Processes loading parts of the file with COPY in parallel, "
+                "can't be combined with --upsert and --incremental"
+            ),
+        )
+        parser.add_argument(
+            "--upsert",
+            action="store_true",
+            help="Insert new and update changed rows by service request number",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Upsert changed file, skip unchanged file and save progress by chunks",
+        )
+
+    def download_example_file(self):
+        print("We have to download example csv file from Chicago City Data Portal.")
+        print(
+            f"Later you can find it at path {EXAMPLE_FILE_PATH} inside project folder."
+        )
+        print(f"URL: {EXAMPLE_FILE_URL}\n")
+        with open(EXAMPLE_FILE_PATH + ".part", "wb") as download_file:
+            with httpx.stream("GET", EXAMPLE_FILE_URL) as response:
+                num_bytes_downloaded = response.num_bytes_downloaded
+                for chunk in response.iter_bytes():
+                    download_file.write(chunk)
+                    num_bytes_downloaded = response.num_bytes_downloaded
+                    print(f"\rDownloaded {num_bytes_downloaded} bytes", end="")
+        os.rename(EXAMPLE_FILE_PATH + ".part", EXAMPLE_FILE_PATH)
 
     def handle(self, *args, **options):
+        if options["workers"] > 1 and (options["upsert"] or options["incremental"]):
+            # Parallel COPY only inserts rows, existing rows would be duplicated
+            raise CommandError(
+                "--workers can't be combined with --upsert or --incremental"
+            )
         if not os.path.exists(EXAMPLE_FILE_PATH):
-            print("We have to download example csv file from Chicago City Data Portal.")
+            self.download_example_file()
+
+        if options["workers"] > 1:
+            self.parallel_import(options["workers"], options["batch_size"])
+            return
+
+        if options["incremental"]:
+            self.incremental_import(EXAMPLE_FILE_PATH, options["batch_size"])
+            return
+
+        # Only one chunk of the file is in memory at once
+        chunks = read_csv_chunks(EXAMPLE_FILE_PATH, options["batch_size"])
+        if options["upsert"]:
+            self.upsert_import(chunks)
+            return
+        if options["bulk"]:
+            self.bulk_import(chunks)
+            return
+
+        for chunk in chunks:
+            for row in self.get_model_rows(chunk):
+                Vehicle.objects.get_or_create(**row)
+
+    def get_vehicle_rows(self, rows):
+        """Vectorized conversion of CSV rows to vehicle fields values."""
+        data = rows[list(CSV_COLUMNS)].rename(columns=CSV_COLUMNS)
+        for field in DATE_FIELDS:
+            data[field] = pd.to_datetime(data[field], format="%m/%d/%Y")
+        for field in INTEGER_FIELDS:
+            if pd.api.types.is_float_dtype(data[field]):
+                data[field] = data[field].astype("Int64")
+        return data
+
+    def get_model_rows(self, rows):
+        """Get vehicle fields values for ORM, empty values are None."""
+        data = self.get_vehicle_rows(rows)
+        data = data.astype(object).where(data.notna(), None)
+        data["location"] = [
+            Point(lon, lat) if has_location else None
+            for lon, lat, has_location in zip(
+                rows["Longitude"], rows["Latitude"], rows["Location"].notna()
+            )
+        ]
+        return data.to_dict("records")
+
+    def get_copy_rows(self, rows):
+        """Get vehicle table columns for COPY, location is in EWKT."""
+        data = self.get_vehicle_rows(rows)
+        for field in DATE_FIELDS:
+            data[field] = data[field].dt.strftime("%Y-%m-%d")
+        data["location"] = (
+            "SRID=4326;POINT("
+            + rows["Longitude"].astype(str)
+            + " "
+            + rows["Latitude"].astype(str)
+            + ")"
+        ).where(rows["Location"].notna())
+        return data
+
+    def bulk_import(self, chunks, first_id=None, report=True, table_name=None):
+        """Load rows to the partitioned vehicle table with COPY FROM STDIN.
+
+        Ids are generated by the database or taken sequentially from first_id.
+        Database triggers fill geohash and grid cells for copied rows as for inserted ones.
+        Other table with the same columns can be loaded instead, for example staging table.
+        """
+        table_name = table_name or Vehicle._meta.db_table
+        started_at = time.monotonic()
+        loaded_count = 0
+        for chunk in chunks:
+            data = self.get_copy_rows(chunk)
+            if first_id is not None:
+                data.insert(0, "id", range(first_id, first_id + len(data)))
+                first_id += len(data)
+            elif table_name == Vehicle._meta.db_table:
+                # New ids must fall into existing partitions
+                call_command("generate_partitions")
+            buffer = io.StringIO()
+            # Empty unquoted values are NULL for COPY
+            data.to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            copy_sql = "COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    copy_sql.format(
+                        table_name=table_name,
+                        columns=", ".join(data.columns),
+                    ),
+                    buffer,
+                )
+            loaded_count += len(data)
+            if report:
+                elapsed = time.monotonic() - started_at
+                print(
+                    f"\rLoaded {loaded_count} rows, {loaded_count / elapsed:.0f} rows/sec",
+                    end="",
+                )
+        if report:
+            print()
+        return loaded_count
+
+    def split_file(self, path, parts):
+        """Split CSV file to byte ranges on line boundaries.
+
+        Returns header column names and (start, end, rows count) for every range.
+        Rows are counted as lines, so quoted values must not contain line breaks.
+        """
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as file:
+            names = next(csv.reader([file.readline().decode("utf-8-sig")]))
+            boundaries = [file.tell()]
+            for part in range(1, parts):
+                file.seek(
+                    max(
+                        boundaries[-1],
+                        boundaries[0] + (file_size - boundaries[0]) * part // parts,
+                    )
+                )
+                file.readline()
+                boundaries.append(file.tell())
+            boundaries.append(file_size)
+
+            ranges = []
+            for start, end in zip(boundaries, boundaries[1:]):
+                if start >= end:
+                    continue
+                file.seek(start)
+                rows_count = 0
+                remaining = end - start
+                while remaining:
+                    block = file.read(min(COUNT_BLOCK_SIZE, remaining))
+                    rows_count += block.count(b"\n")
+                    remaining -= len(block)
+                # The last line without line break
+                if not block.endswith(b"\n"):
+                    rows_count += 1
+                ranges.append((start, end, rows_count))
+        return names, ranges
+
+    def reserve_ids(self, rows_counts):
+        """Reserve ids for all workers and return first id for every worker.
+
+        Every worker starts from a new partition, so workers don't write to the same partitions.
+        """
+        table_name = Vehicle._meta.db_table
+        partition_size = Vehicle.custom_partitioned["size"]
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Other writers wait until the sequence is moved
+            cursor.execute(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table_name]
+            )
+            next_id = cursor.fetchone()[0]
+            first_ids = []
+            for rows_count in rows_counts:
+                first_ids.append(next_id)
+                next_id = -(-(next_id + rows_count) // partition_size) * partition_size
+            last_id = first_ids[-1] + rows_counts[-1] - 1
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                [table_name, last_id],
+            )
+        return first_ids, last_id
+
+    def sync_sequence(self):
+        """Move the sequence after the largest loaded id."""
+        SQL_SYNC_SEQUENCE = """
+            SELECT setval(
+                sequence_name::regclass,
+                GREATEST(
+                    (SELECT COALESCE(MAX(id), 1) FROM {table_name}),
+                    COALESCE(pg_sequence_last_value(sequence_name::regclass), 1)
+                )
+            )
+            FROM pg_get_serial_sequence(%(table_name)s, 'id') AS sequence_name
+        """
+        table_name = Vehicle._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SQL_SYNC_SEQUENCE.format(table_name=table_name),
+                {"table_name": table_name},
+            )
+
+    def parallel_import(self, workers, batch_size):
+        """Load byte ranges of the file in worker processes with COPY."""
+        names, ranges = self.split_file(EXAMPLE_FILE_PATH, workers)
+        if not ranges:
+            return
+        first_ids, last_id = self.reserve_ids(
+            [rows_count for _, _, rows_count in ranges]
+        )
+        call_command("generate_partitions", max_value=last_id)
+
+        # Forked workers must not share connections with the parent
+        connections.close_all()
+        started_at = time.monotonic()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    import_file_range,
+                    EXAMPLE_FILE_PATH,
+                    names,
+                    start,
+                    end,
+                    first_id,
+                    batch_size,
+                )
+                for (start, end, _), first_id in zip(ranges, first_ids)
+            ]
+            loaded_count = sum(future.result() for future in futures)
+        self.sync_sequence()
+
+        elapsed = time.monotonic() - started_at
+        print(
+            f"Loaded {loaded_count} rows by {len(ranges)} workers, "
+            f"{loaded_count / elapsed:.0f} rows/sec"
+        )
+
+    def get_staging_params(self):
+        columns = list(CSV_COLUMNS.values()) + ["location"]
+        changed_columns = [
+            column for column in columns if column != "service_request_number"
+        ]
+        return {
+            "table_name": Vehicle._meta.db_table,
+            "staging_table": STAGING_TABLE,
+            "columns": ", ".join(columns),
+            "source_columns": ", ".join(f"source.{column}" for column in columns),
+            "vehicle_columns": ", ".join(f"vehicle.{column}" for column in columns),
+            "update_columns": ", ".join(
+                f"{column} = source.{column}" for column in changed_columns
+            ),
+        }
+
+    def create_staging_table(self):
+        SQL_CREATE_STAGING = """
+            CREATE TEMPORARY TABLE {staging_table} AS
+            SELECT {columns} FROM {table_name} WITH NO DATA;
+            -- The last row in the file wins for duplicated service request numbers
+            ALTER TABLE {staging_table} ADD COLUMN import_row bigserial;
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            cursor.execute(SQL_CREATE_STAGING.format(**self.get_staging_params()))
+
+    def drop_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+
+    def merge_staging_table(self):
+        """Merge staging rows to the vehicle table by service request number.
+
+        Only new rows and rows with changed values are written to the vehicle table.
+        Returns written rows count.
+        """
+        # Upper bound for new ids, partitions must exist for them
+        SQL_MAX_NEW_ID = """
+            SELECT COALESCE(pg_sequence_last_value(pg_get_serial_sequence(%(table_name)s, 'id')::regclass), 0)
+                + (SELECT count(*) FROM {staging_table})
+        """
+        SQL_MERGE = """
+            MERGE INTO {table_name} AS vehicle
+            USING
+            (SELECT DISTINCT ON (service_request_number) *
+            FROM {staging_table}
+            ORDER BY service_request_number, import_row DESC) AS source
+            ON vehicle.service_request_number = source.service_request_number
+            WHEN MATCHED AND ({vehicle_columns}) IS DISTINCT FROM ({source_columns}) THEN
+                UPDATE SET {update_columns}
+            WHEN NOT MATCHED THEN
+                INSERT ({columns}) VALUES ({source_columns})
+        """
+        sql_params = self.get_staging_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SQL_MAX_NEW_ID.format(**sql_params),
+                {"table_name": sql_params["table_name"]},
+            )
+            call_command("generate_partitions", max_value=cursor.fetchone()[0])
+            cursor.execute(SQL_MERGE.format(**sql_params))
+            return cursor.rowcount
+
+    def upsert_import(self, chunks):
+        """Load rows to the staging table and merge them by service request number.
+
+        Service request number isn't unique in the partitioned table, so MERGE is used instead of ON CONFLICT.
+        """
+        try:
+            self.create_staging_table()
+            self.bulk_import(chunks, table_name=STAGING_TABLE)
+            started_at = time.monotonic()
+            merged_count = self.merge_staging_table()
             print(
-                f"Later you can find it at path {EXAMPLE_FILE_PATH} inside project folder."
+                f"Merged {merged_count} new or changed rows "
+                f"in {time.monotonic() - started_at:.1f} sec"
             )
-            print(f"URL: {EXAMPLE_FILE_URL}\n")
-            with open(EXAMPLE_FILE_PATH + ".part", "wb") as download_file:
-                with httpx.stream("GET", EXAMPLE_FILE_URL) as response:
-                    num_bytes_downloaded = response.num_bytes_downloaded
-                    for chunk in response.iter_bytes():
-                        download_file.write(chunk)
-                        num_bytes_downloaded = response.num_bytes_downloaded
-                        print(f"\rDownloaded {num_bytes_downloaded} bytes", end="")
-            os.rename(EXAMPLE_FILE_PATH + ".part", EXAMPLE_FILE_PATH)
-
-        df = pd.read_csv(EXAMPLE_FILE_PATH)
-        df_correct = df.replace({np.nan: None})
-        for index, row in df_correct.iterrows():
-            print(row)
-            Vehicle.objects.get_or_create(
-                creation_date=self.parse_date(row["Creation Date"]),
-                status=row["Status"],
-                completion_date=self.parse_date(row["Completion Date"]),
-                service_request_number=row["Service Request Number"],
-                type_of_service_request=row["Type of Service Request"],
-                license_plate=row["License Plate"],
-                vehicle_make=row["Vehicle Make/Model"],
-                vehicle_color=row["Vehicle Color"],
-                current_activity=row["Current Activity"],
-                most_recent_action=row["Most Recent Action"],
-                days_parked=row[
-                    "How Many Days Has the Vehicle Been Reported as Parked?"
-                ],
-                street_address=row["Street Address"],
-                zip_code=row["ZIP Code"],
-                x_coordinate=row["X Coordinate"],
-                y_coordinate=row["Y Coordinate"],
-                ward=row["Ward"],
-                police_district=row["Police District"],
-                community_area=row["Community Area"],
-                ssa=row["SSA"],
-                latitude=row["Latitude"],
-                longitude=row["Longitude"],
-                location=Point(row["Longitude"], row["Latitude"])
-                if row["Location"]
-                else None,
+        finally:
+            self.drop_staging_table()
+
+    def get_file_hash(self, path):
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            while block := file.read(COUNT_BLOCK_SIZE):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def incremental_import(self, path, batch_size):
+        """Upsert all rows of the changed file, only new and changed rows are written.
+
+        Unchanged file is skipped by its hash. Rows are compared with the vehicle table
+        by all columns in MERGE, so changes of any value are found, not only new dates.
+        Progress is saved with every chunk, so a failed import of the same file continues
+        from the last chunk. Failed import of another file version starts from the first row.
+        """
+        file_hash = self.get_file_hash(path)
+        checkpoints = ImportCheckpoint.objects.filter(file_path=path).order_by("-id")
+        last_completed = checkpoints.filter(
+            status=ImportCheckpoint.Status.COMPLETED
+        ).first()
+        if last_completed and last_completed.file_hash == file_hash:
+            print("File is not changed since the last import")
+            return
+
+        checkpoint = checkpoints.filter(status=ImportCheckpoint.Status.RUNNING).first()
+        if checkpoint and checkpoint.file_hash == file_hash:
+            print(f"Continue failed import after {checkpoint.rows_processed} rows")
+        elif checkpoint:
+            # Rows may be changed or moved in the new file version
+            print("File is changed since the failed import, start from the first row")
+            checkpoint.file_hash = file_hash
+            checkpoint.rows_processed = 0
+            checkpoint.rows_merged = 0
+            checkpoint.save()
+        else:
+            checkpoint = ImportCheckpoint.objects.create(
+                file_path=path, file_hash=file_hash
             )
+
+        chunks = read_csv_chunks(
+            path, batch_size, skiprows=range(1, checkpoint.rows_processed + 1)
+        )
+        try:
+            self.create_staging_table()
+            for chunk in chunks:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+                # Merged rows and progress are saved together
+                with transaction.atomic():
+                    self.bulk_import([chunk], table_name=STAGING_TABLE, report=False)
+                    checkpoint.rows_merged += self.merge_staging_table()
+                    checkpoint.rows_processed += len(chunk)
+                    checkpoint.save()
+                print(
+                    f"\rProcessed {checkpoint.rows_processed} rows, "
+                    f"merged {checkpoint.rows_merged} new or changed rows",
+                    end="",
+                )
+            print()
+        finally:
+            self.drop_staging_table()
+
+        checkpoint.status = ImportCheckpoint.Status.COMPLETED
+        checkpoint.save()
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from main.cache import get_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for map clusters cache."
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        total = stats["hits"] + stats["misses"]
+        hit_ratio = stats["hits"] / total * 100 if total else 0
+        print(f"Hits: {stats['hits']}")
+        print(f"Misses: {stats['misses']}")
+        print(f"Hit ratio: {hit_ratio:.1f}%")
@@ -0,0 +1,65 @@
+from django.core.management import BaseCommand
+
+from main.db import explain_analyze, iter_plan_nodes
+from main.models import Vehicle
+from main.views import VehicleMapLargeCountListView, VehicleMapListView
+
+SCAN_NODES = ["Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan"]
+
+
+class Command(BaseCommand):
+    help = "Report scans, heap access and buffers of vehicle partitions in map queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bbox",
+            nargs=4,
+            type=float,
+            default=[-87.708, 41.849, -87.6, 41.85],
+            metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+        )
+
+    def handle(self, *args, **options):
+        queries = {}
+        for name, view_class in [
+            ("dbscan", VehicleMapListView),
+            ("grid", VehicleMapLargeCountListView),
+        ]:
+            view = view_class()
+            view.set_bbox(*options["bbox"])
+            queryset = Vehicle.objects.filter(
+                location__isnull=False,
+                location__coveredby=view.polygon,
+            )
+            queries[name] = view.get_map_sql(queryset)
+
+        for name, (sql, params) in queries.items():
+            plan = explain_analyze(sql, params)
+            scans = {node_type: 0 for node_type in SCAN_NODES}
+            heap_fetches = 0
+            heap_blocks = 0
+            hit_blocks = 0
+            read_blocks = 0
+            for node in iter_plan_nodes(plan):
+                if node["Node Type"] not in scans:
+                    continue
+                if not node.get("Relation Name", "").startswith(Vehicle._meta.db_table):
+                    continue
+                scans[node["Node Type"]] += node["Actual Rows"] * node["Actual Loops"]
+                heap_fetches += node.get("Heap Fetches", 0)
+                heap_blocks += node.get("Exact Heap Blocks", 0)
+                heap_blocks += node.get("Lossy Heap Blocks", 0)
+                # Buffers of the scan node include its bitmap index scan
+                hit_blocks += node["Shared Hit Blocks"]
+                read_blocks += node["Shared Read Blocks"]
+
+            print(f"{name}: {plan['Actual Total Time']:.1f} ms")
+            for node_type, rows in scans.items():
+                print(f"  {node_type}: {rows} rows")
+            print(f"  Heap fetches: {heap_fetches}")
+            print(f"  Bitmap heap blocks: {heap_blocks}")
+            print(f"  Partitions shared buffers hit/read: {hit_blocks}/{read_blocks}")
+            print(
+                f"  Query shared buffers hit/read: "
+                f"{plan['Shared Hit Blocks']}/{plan['Shared Read Blocks']}"
+            )
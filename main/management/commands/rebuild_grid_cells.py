@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from main.models import Vehicle, VehicleGridCell
+
+
+class Command(BaseCommand):
+    help = "Rebuild trigger maintained grid cell aggregates from scratch."
+
+    def handle(self, *args, **options):
+        SQL_BUILD_LEVEL = """
+            INSERT INTO {cell_table} (level, cell_x, cell_y, vehicles_count, lon_sum, lat_sum)
+            SELECT %(level)s,
+                floor(ST_X(location) / %(cell_size)s)::integer AS cell_x,
+                floor(ST_Y(location) / %(cell_size)s)::integer AS cell_y,
+                count(*),
+                sum(ST_X(location)),
+                sum(ST_Y(location))
+            FROM {vehicle_table}
+            WHERE location IS NOT NULL
+            GROUP BY cell_x, cell_y
+        """
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Block vehicle writes, so triggers don't change cells during rebuild
+                cursor.execute(
+                    f"LOCK TABLE {Vehicle._meta.db_table} IN SHARE MODE",
+                )
+                VehicleGridCell.objects.all().delete()
+                for level, cell_size in enumerate(VehicleGridCell.CELL_SIZES):
+                    cursor.execute(
+                        SQL_BUILD_LEVEL.format(
+                            cell_table=VehicleGridCell._meta.db_table,
+                            vehicle_table=Vehicle._meta.db_table,
+                        ),
+                        {
+                            "level": level,
+                            "cell_size": cell_size,
+                        },
+                    )
+                    print(f"Level {level}: {cursor.rowcount} cells created")
@@ -0,0 +1,80 @@
+import logging
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+from main.cache import (
+    COMPRESSED_RESPONSES_KEY,
+    COMPRESSION_BYTES_SAVED_KEY,
+    increment_counter,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+re_accepts_gzip = _lazy_re_compile(r"\bgzip\b")
+
+
+class CompressionMiddleware:
+    """Compress API responses larger than COMPRESSION_MIN_SIZE with brotli or gzip.
+
+    Brotli is used only when "brotli" package is installed.
+    Streamed responses are sent as is, so clients get first rows without delay.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not request.path.startswith(tuple(settings.COMPRESSION_PATH_PREFIXES)):
+            return response
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+
+        # Response depends on Accept-Encoding even when it isn't compressed
+        patch_vary_headers(response, ("Accept-Encoding",))
+        original_size = len(response.content)
+        if original_size < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            encoding = "br"
+            compressed_content = brotli.compress(
+                response.content, quality=settings.COMPRESSION_BROTLI_QUALITY
+            )
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding = "gzip"
+            compressed_content = compress_string(response.content)
+        else:
+            return response
+        if len(compressed_content) >= original_size:
+            return response
+
+        response.content = compressed_content
+        response["Content-Length"] = str(len(compressed_content))
+        response["Content-Encoding"] = encoding
+        # Strong ETag is for the original content only
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+
+        bytes_saved = original_size - len(compressed_content)
+        increment_counter(COMPRESSED_RESPONSES_KEY)
+        increment_counter(COMPRESSION_BYTES_SAVED_KEY, bytes_saved)
+        logger.debug(
+            "%s compressed with %s: %s -> %s bytes",
+            request.path,
+            encoding,
+            original_size,
+            len(compressed_content),
+        )
+        return response
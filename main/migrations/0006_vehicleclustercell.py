@@ -0,0 +1,54 @@
+# Generated by Django 4.1.6 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0005_PARTITIONING_VEHICLE"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VehicleClusterCell",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.SmallIntegerField()),
+                ("cell_x", models.IntegerField()),
+                ("cell_y", models.IntegerField()),
+                (
+                    "vehicle_color",
+                    models.CharField(blank=True, max_length=250, null=True),
+                ),
+                ("vehicles_count", models.IntegerField()),
+                ("lon_sum", models.FloatField()),
+                ("lat_sum", models.FloatField()),
+                (
+                    "vehicle_make",
+                    models.CharField(blank=True, max_length=250, null=True),
+                ),
+                ("creation_date", models.DateField(blank=True, null=True)),
+                ("completion_date", models.DateField(blank=True, null=True)),
+                (
+                    "type_of_service_request",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["zoom", "cell_x", "cell_y"],
+                        name="main_vehicl_zoom_cebda7_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,149 @@
+# Generated by Django 4.1.6 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+# Levels must match VehicleGridCell.CELL_SIZES
+SQL_GRID_LEVELS = """
+    (VALUES (0, 0.0005::float8), (1, 0.002), (2, 0.008), (3, 0.032), (4, 0.128)) AS levels(level, cell_size)
+"""
+
+# Add signed locations to the grid cells, "delta" subquery returns (location, sign)
+SQL_APPLY_DELTA = (
+    """
+        INSERT INTO main_vehiclegridcell AS cell (level, cell_x, cell_y, vehicles_count, lon_sum, lat_sum)
+        SELECT levels.level,
+            floor(ST_X(delta.location) / levels.cell_size)::integer AS cell_x,
+            floor(ST_Y(delta.location) / levels.cell_size)::integer AS cell_y,
+            sum(delta.sign),
+            sum(delta.sign * ST_X(delta.location)),
+            sum(delta.sign * ST_Y(delta.location))
+        FROM ({delta}) delta
+        CROSS JOIN """
+    + SQL_GRID_LEVELS
+    + """
+        WHERE delta.location IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (level, cell_x, cell_y) DO UPDATE
+        SET vehicles_count = cell.vehicles_count + EXCLUDED.vehicles_count,
+            lon_sum = cell.lon_sum + EXCLUDED.lon_sum,
+            lat_sum = cell.lat_sum + EXCLUDED.lat_sum;
+    """
+)
+
+# Only rows with changed location, other updates don't touch grid
+SQL_CHANGED_LOCATIONS = """
+    SELECT changed.location, changed.sign
+    FROM old_rows
+    INNER JOIN new_rows ON new_rows.id = old_rows.id,
+    LATERAL (VALUES (old_rows.location, -1), (new_rows.location, 1)) AS changed(location, sign)
+    WHERE old_rows.location IS DISTINCT FROM new_rows.location
+"""
+
+DDL_GRID_TRIGGERS = [
+    """
+    -- Apply location changes of every write statement to the grid cells
+    CREATE OR REPLACE FUNCTION main_vehiclegridcell_apply() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+    """
+    + SQL_APPLY_DELTA.format(delta="SELECT location, 1 AS sign FROM new_rows")
+    + """
+        ELSIF TG_OP = 'DELETE' THEN
+    """
+    + SQL_APPLY_DELTA.format(delta="SELECT location, -1 AS sign FROM old_rows")
+    + """
+            DELETE FROM main_vehiclegridcell WHERE vehicles_count <= 0;
+        ELSE
+    """
+    + SQL_APPLY_DELTA.format(delta=SQL_CHANGED_LOCATIONS)
+    + """
+            DELETE FROM main_vehiclegridcell WHERE vehicles_count <= 0;
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER main_vehicle_grid_insert
+        AFTER INSERT ON main_vehicle
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION main_vehiclegridcell_apply();
+    CREATE TRIGGER main_vehicle_grid_update
+        AFTER UPDATE ON main_vehicle
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION main_vehiclegridcell_apply();
+    CREATE TRIGGER main_vehicle_grid_delete
+        AFTER DELETE ON main_vehicle
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION main_vehiclegridcell_apply();
+    """,
+    """
+    -- Aggregate already existing vehicles
+    INSERT INTO main_vehiclegridcell (level, cell_x, cell_y, vehicles_count, lon_sum, lat_sum)
+    SELECT levels.level,
+        floor(ST_X(location) / levels.cell_size)::integer AS cell_x,
+        floor(ST_Y(location) / levels.cell_size)::integer AS cell_y,
+        count(*),
+        sum(ST_X(location)),
+        sum(ST_Y(location))
+    FROM main_vehicle
+    CROSS JOIN """
+    + SQL_GRID_LEVELS
+    + """
+    WHERE location IS NOT NULL
+    GROUP BY 1, 2, 3;
+    """,
+]
+
+DDL_DROP_GRID_TRIGGERS = """
+    DROP TRIGGER IF EXISTS main_vehicle_grid_insert ON main_vehicle;
+    DROP TRIGGER IF EXISTS main_vehicle_grid_update ON main_vehicle;
+    DROP TRIGGER IF EXISTS main_vehicle_grid_delete ON main_vehicle;
+    DROP FUNCTION IF EXISTS main_vehiclegridcell_apply();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0006_vehicleclustercell"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VehicleGridCell",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("level", models.SmallIntegerField()),
+                ("cell_x", models.IntegerField()),
+                ("cell_y", models.IntegerField()),
+                ("vehicles_count", models.IntegerField()),
+                ("lon_sum", models.FloatField()),
+                ("lat_sum", models.FloatField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("vehicles_count__lte", 0)),
+                        fields=["vehicles_count"],
+                        name="main_vehiclegridcell_empty",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="vehiclegridcell",
+            constraint=models.UniqueConstraint(
+                fields=("level", "cell_x", "cell_y"),
+                name="main_vehiclegridcell_unique_cell",
+            ),
+        ),
+        migrations.RunSQL(DDL_GRID_TRIGGERS, reverse_sql=DDL_DROP_GRID_TRIGGERS),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.6 on 2026-10-17 14:00
+
+from django.db import migrations, models
+
+DDL_GEOHASH_TRIGGER = """
+    -- Keep geohash in sync with location for all writes, including raw SQL and COPY
+    CREATE OR REPLACE FUNCTION main_vehicle_set_geohash() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF NEW.location IS NULL THEN
+            NEW.geohash := NULL;
+        ELSE
+            NEW.geohash := ST_GeoHash(NEW.location, 12);
+        END IF;
+        RETURN NEW;
+    END;
+    $$;
+
+    CREATE TRIGGER main_vehicle_geohash
+        BEFORE INSERT OR UPDATE OF location ON main_vehicle
+        FOR EACH ROW EXECUTE FUNCTION main_vehicle_set_geohash();
+"""
+
+DDL_DROP_GEOHASH_TRIGGER = """
+    DROP TRIGGER IF EXISTS main_vehicle_geohash ON main_vehicle;
+    DROP FUNCTION IF EXISTS main_vehicle_set_geohash();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0007_vehiclegridcell"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vehicle",
+            name="geohash",
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.RunSQL(DDL_GEOHASH_TRIGGER, reverse_sql=DDL_DROP_GEOHASH_TRIGGER),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.6 on 2026-10-17 16:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0008_vehicle_geohash"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        # Indexes on partitioned table are created for every existing partition
+        # and for every partition created later by "generate_partitions"
+        migrations.AddIndex(
+            model_name="vehicle",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("vehicle_make"),
+                    name="gin_trgm_ops",
+                ),
+                name="main_vehicle_make_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vehicle",
+            index=models.Index(
+                django.db.models.functions.text.Upper(
+                    django.db.models.functions.text.Trim("vehicle_make")
+                ),
+                name="main_vehicle_make_normalized",
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.1.6 on 2026-10-17 18:00
+
+from django.db import migrations
+
+# Levels must match VehicleGridCell.CELL_SIZES
+SQL_GRID_LEVELS = """
+    (VALUES (0, 0.0005::float8), (1, 0.002), (2, 0.008), (3, 0.032), (4, 0.128)) AS levels(level, cell_size)
+"""
+
+# Same as in 0007, but cells are locked in the same order by all transactions,
+# so concurrent loads don't deadlock on the shared cells
+SQL_APPLY_DELTA = (
+    """
+        INSERT INTO main_vehiclegridcell AS cell (level, cell_x, cell_y, vehicles_count, lon_sum, lat_sum)
+        SELECT levels.level,
+            floor(ST_X(delta.location) / levels.cell_size)::integer AS cell_x,
+            floor(ST_Y(delta.location) / levels.cell_size)::integer AS cell_y,
+            sum(delta.sign),
+            sum(delta.sign * ST_X(delta.location)),
+            sum(delta.sign * ST_Y(delta.location))
+        FROM ({delta}) delta
+        CROSS JOIN """
+    + SQL_GRID_LEVELS
+    + """
+        WHERE delta.location IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (level, cell_x, cell_y) DO UPDATE
+        SET vehicles_count = cell.vehicles_count + EXCLUDED.vehicles_count,
+            lon_sum = cell.lon_sum + EXCLUDED.lon_sum,
+            lat_sum = cell.lat_sum + EXCLUDED.lat_sum;
+    """
+)
+
+# Old and new locations of updated rows with changed location
+SQL_CHANGED_LOCATIONS = """
+    SELECT changed.location, changed.sign
+    FROM old_rows
+    INNER JOIN new_rows ON new_rows.id = old_rows.id,
+    LATERAL (VALUES (old_rows.location, -1), (new_rows.location, 1)) AS changed(location, sign)
+    WHERE old_rows.location IS DISTINCT FROM new_rows.location
+"""
+
+DDL_GRID_APPLY_FUNCTION = (
+    """
+    CREATE OR REPLACE FUNCTION main_vehiclegridcell_apply() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+    """
+    + SQL_APPLY_DELTA.format(delta="SELECT location, 1 AS sign FROM new_rows")
+    + """
+        ELSIF TG_OP = 'DELETE' THEN
+    """
+    + SQL_APPLY_DELTA.format(delta="SELECT location, -1 AS sign FROM old_rows")
+    + """
+            DELETE FROM main_vehiclegridcell WHERE vehicles_count <= 0;
+        ELSE
+    """
+    + SQL_APPLY_DELTA.format(delta=SQL_CHANGED_LOCATIONS)
+    + """
+            DELETE FROM main_vehiclegridcell WHERE vehicles_count <= 0;
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+    """
+)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0009_vehicle_make_trigram_indexes"),
+    ]
+
+    operations = [
+        # Unordered function is the same apart from lock order, nothing to revert
+        migrations.RunSQL(DDL_GRID_APPLY_FUNCTION, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.6 on 2026-10-17 21:00
+
+from django.db import migrations, models
+
+DDL_DATA_VERSION_TRIGGERS = """
+    CREATE SEQUENCE main_dataversion_version_seq;
+
+    -- Set new version for the data set from the trigger argument, row is visible after commit only
+    CREATE OR REPLACE FUNCTION main_dataversion_bump() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO main_dataversion (name, version)
+        VALUES (TG_ARGV[0], nextval('main_dataversion_version_seq'))
+        ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER main_vehicle_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON main_vehicle
+        FOR EACH STATEMENT EXECUTE FUNCTION main_dataversion_bump('vehicle');
+    -- Rebuilt cluster pyramid changes pyramid responses without vehicle changes
+    CREATE TRIGGER main_vehicleclustercell_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON main_vehicleclustercell
+        FOR EACH STATEMENT EXECUTE FUNCTION main_dataversion_bump('pyramid');
+"""
+
+DDL_DROP_DATA_VERSION_TRIGGERS = """
+    DROP TRIGGER IF EXISTS main_vehicleclustercell_data_version ON main_vehicleclustercell;
+    DROP TRIGGER IF EXISTS main_vehicle_data_version ON main_vehicle;
+    DROP FUNCTION IF EXISTS main_dataversion_bump();
+    DROP SEQUENCE IF EXISTS main_dataversion_version_seq;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0012_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("version", models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunSQL(
+            DDL_DATA_VERSION_TRIGGERS, reverse_sql=DDL_DROP_DATA_VERSION_TRIGGERS
+        ),
+    ]
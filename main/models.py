@@ -1,5 +1,7 @@
 from django.contrib.gis.db.models import PointField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Trim, Upper
 
 # from psqlextra.types import PostgresPartitioningMethod
 # from psqlextra.models import PostgresPartitionedModel
@@ -107,6 +109,13 @@ class Vehicle(models.Model):
         null=True,
         blank=True,
     )
+    # Filled by database trigger from location
+    geohash = models.CharField(
+        max_length=12,
+        null=True,
+        blank=True,
+        db_index=True,
+    )
     responsible = models.ForeignKey(
         "Responsible",
         null=True,
@@ -114,6 +123,19 @@ class Vehicle(models.Model):
     )
     objects = InheritanceManager()
 
+    class Meta:
+        indexes = [
+            # Serves case insensitive "contains" make filter
+            GinIndex(
+                OpClass(Upper("vehicle_make"), name="gin_trgm_ops"),
+                name="main_vehicle_make_trgm",
+            ),
+            models.Index(
+                Upper(Trim("vehicle_make")),
+                name="main_vehicle_make_normalized",
+            ),
+        ]
+
 
 class CriminalVehicle(Vehicle):
     custom_partitioned = {
@@ -170,3 +192,139 @@ class Comment(models.Model):
     )
     name = models.CharField(max_length=255)
     text = models.TextField()
+
+
+class VehicleClusterCell(models.Model):
+    """Precomputed grid cell aggregates for the map cluster pyramid.
+
+    Cell size for the zoom level is 360 / 2 ** zoom degrees.
+    Rows are split by vehicle color, so the pyramid can also serve color filter.
+    """
+
+    zoom = models.SmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    vehicle_color = models.CharField(
+        max_length=250,
+        null=True,
+        blank=True,
+    )
+    vehicles_count = models.IntegerField()
+    lon_sum = models.FloatField()
+    lat_sum = models.FloatField()
+    # Filled for cells with single vehicle only
+    vehicle_make = models.CharField(
+        max_length=250,
+        null=True,
+        blank=True,
+    )
+    creation_date = models.DateField(
+        null=True,
+        blank=True,
+    )
+    completion_date = models.DateField(
+        null=True,
+        blank=True,
+    )
+    type_of_service_request = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["zoom", "cell_x", "cell_y"]),
+        ]
+
+    @staticmethod
+    def get_cell_size(zoom):
+        return 360 / 2**zoom
+
+
+class VehicleGridCell(models.Model):
+    """Grid cell aggregates for all vehicles.
+
+    Table is maintained incrementally by statement triggers on the vehicle table
+    (see migration 0007), so it's always in sync with writes.
+    Cell size for the level is CELL_SIZES[level] degrees.
+    """
+
+    # Must match levels in the trigger function
+    CELL_SIZES = [0.0005, 0.002, 0.008, 0.032, 0.128]
+
+    level = models.SmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    vehicles_count = models.IntegerField()
+    lon_sum = models.FloatField()
+    lat_sum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["level", "cell_x", "cell_y"],
+                name="main_vehiclegridcell_unique_cell",
+            ),
+        ]
+        indexes = [
+            # Almost empty index for cleanup of cells without vehicles
+            models.Index(
+                fields=["vehicles_count"],
+                condition=models.Q(vehicles_count__lte=0),
+                name="main_vehiclegridcell_empty",
+            ),
+        ]
+
+
+class DataVersion(models.Model):
+    """Version of the data set, it is changed with every write statement.
+
+    Versions are set by statement triggers in the same transaction as the write
+    (see migration 0014) and are taken from the sequence, so they are never reused.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField()
+
+
+class StatsCounter(models.Model):
+    """Counter shared by all server processes and management commands.
+
+    Values are incremented by atomic upsert, see "main.cache.increment_counter".
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of "import_rows" incremental run for one input file.
+
+    Rows are processed in file order, so a failed run of the same file
+    is resumed after "rows_processed" rows.
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = "running"
+        COMPLETED = "completed"
+
+    file_path = models.CharField(max_length=500)
+    file_hash = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.RUNNING,
+    )
+    rows_processed = models.BigIntegerField(default=0)
+    rows_merged = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["file_path", "-id"],
+                name="main_importcheckpoint_path",
+            ),
+        ]
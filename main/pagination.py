@@ -0,0 +1,47 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+from main.db import estimate_vehicles_count
+
+
+class VehicleCursorPagination(CursorPagination):
+    """Keyset pagination which seeks with "id > last id".
+
+    Page cost doesn't depend on the page depth, partitions before the cursor
+    are pruned and there is no count query.
+    """
+
+    ordering = "id"
+    page_size_query_param = "limit"
+    max_page_size = 1000
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """Limit/offset pagination with planner estimated count.
+
+    Exact count is used only when estimate is below the threshold.
+    """
+
+    count_is_estimated = False
+
+    def get_count(self, queryset):
+        count = estimate_vehicles_count(queryset)
+        if count < settings.PAGINATION_EXACT_COUNT_THRESHOLD:
+            self.count_is_estimated = False
+            return super().get_count(queryset)
+        self.count_is_estimated = True
+        return count
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["count_is_estimated"] = self.count_is_estimated
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_is_estimated"] = {
+            "type": "boolean",
+            "example": True,
+        }
+        return response_schema
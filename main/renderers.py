@@ -0,0 +1,64 @@
+import json
+import struct
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+import numpy as np
+
+# Buffers are aligned, so client can create typed arrays without copying
+BUFFER_ALIGNMENT = 8
+
+
+class ColumnarRenderer(BaseRenderer):
+    """Compact columnar binary format.
+
+    Layout:
+        4 bytes - "VCOL" magic
+        4 bytes - header length, little-endian uint32
+        header  - JSON with rows count, dictionaries and columns description
+                  (name, dtype, offset from the data start, length in bytes)
+        data    - little-endian column buffers, every one aligned to 8 bytes
+
+    Expected data is dict with "count", "columns" (name -> numpy array),
+    "dictionaries" (name -> list of values) and "meta" keys.
+    Any other data (errors) is rendered as JSON.
+    """
+
+    media_type = "application/x-vehicle-columns"
+    format = "columns"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict) or "columns" not in data:
+            return JSONRenderer().render(data)
+
+        columns = []
+        buffers = []
+        offset = 0
+        for name, array in data["columns"].items():
+            buffer = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+            buffer = buffer.tobytes()
+            columns.append(
+                {
+                    "name": name,
+                    "dtype": array.dtype.name,
+                    "offset": offset,
+                    "length": len(buffer),
+                }
+            )
+            padding = -len(buffer) % BUFFER_ALIGNMENT
+            buffers.append(buffer + b"\0" * padding)
+            offset += len(buffer) + padding
+
+        header = json.dumps(
+            {
+                "count": data["count"],
+                "columns": columns,
+                "dictionaries": data["dictionaries"],
+                "meta": data.get("meta", {}),
+            },
+            separators=(",", ":"),
+        ).encode()
+        header += b" " * (-(len(header) + 8) % BUFFER_ALIGNMENT)
+        return b"".join([b"VCOL", struct.pack("<I", len(header)), header] + buffers)
@@ -1,3 +1,5 @@
+from django.conf import settings
+
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeometrySerializerMethodField
 from main.models import Vehicle
@@ -6,14 +8,14 @@ from main.models import Vehicle
 class VehicleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vehicle
-        exclude = ["id"]
+        # Geohash is an internal index column
+        exclude = ["id", "geohash"]
 
 
 class VehicleForJSSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vehicle
         fields = [
-            "vehicle_make",
             "vehicle_make",
             "vehicle_color",
             "creation_date",
@@ -35,3 +37,30 @@ class MapVehicleSerializer(serializers.Serializer):
 
     def get_location(self, obj):
         return obj["location"]
+
+
+class MapViewportSerializer(serializers.Serializer):
+    key = serializers.CharField(max_length=100)
+    min_lon = serializers.FloatField(min_value=-180, max_value=180)
+    min_lat = serializers.FloatField(min_value=-90, max_value=90)
+    max_lon = serializers.FloatField(min_value=-180, max_value=180)
+    max_lat = serializers.FloatField(min_value=-90, max_value=90)
+
+    def validate(self, attrs):
+        if attrs["min_lon"] >= attrs["max_lon"] or attrs["min_lat"] >= attrs["max_lat"]:
+            raise serializers.ValidationError("Empty viewport")
+        return attrs
+
+
+class MapBatchSerializer(serializers.Serializer):
+    viewports = MapViewportSerializer(many=True, allow_empty=False)
+
+    def validate_viewports(self, viewports):
+        if len(viewports) > settings.MAP_BATCH_MAX_VIEWPORTS:
+            raise serializers.ValidationError(
+                f"Maximum {settings.MAP_BATCH_MAX_VIEWPORTS} viewports allowed"
+            )
+        keys = [viewport["key"] for viewport in viewports]
+        if len(set(keys)) != len(keys):
+            raise serializers.ValidationError("Viewport keys must be unique")
+        return viewports
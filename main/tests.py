@@ -1,13 +1,31 @@
+import csv
+import gzip
+import io
+import json
+import os
+import struct
+import tempfile
+from contextlib import redirect_stdout
 from datetime import date
 from random import uniform
+from unittest import mock
 
 from django.contrib.gis.geos import Point
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
 
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 
+from asgiref.sync import async_to_sync
 from ddf import G
 
-from .models import Vehicle
+from .cache import get_map_cache
+from .db import estimate_vehicles_count
+from .management.commands import import_rows
+from .models import ImportCheckpoint, Vehicle, VehicleGridCell
+from .views import VehicleMapListView
 
 
 class GeoTestCase(APITestCase):
@@ -59,6 +77,20 @@ class GeoTestCase(APITestCase):
         self.assertEqual(len(result.json()), 1)
         self.assertEqual(result.json()[0]["vehicles_count"], 50)
 
+    def test_map_vehicles_count_type(self):
+        """Test vehicles count is integer for trigger maintained and edge cells"""
+
+        for url in [
+            "/api/vehicles/map/",
+            "/api/vehicles/map_fast/",
+            "/api/vehicles/map_fast/?min_lat=40.001&max_lat=40.099&min_lon=40.001&max_lon=40.099",
+        ]:
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+            self.assertTrue(result.json())
+            for cluster in result.json():
+                self.assertIsInstance(cluster["vehicles_count"], int)
+
     def test_map_filter1(self):
         """Test map with filtering #1
 
@@ -89,6 +121,306 @@ class GeoTestCase(APITestCase):
 
         self.assertAlmostEqual(clusters_count1, clusters_count2, delta=1)
 
+    def test_map_numpy(self):
+        """Test clustering in the web worker"""
+
+        filter_condition = "?vehicle_make__icontains=audi&min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        result = self.client.get(f"/api/vehicles/map/{filter_condition}&engine=numpy")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 20)
+        for cluster in result.json():
+            if cluster["vehicles_count"] == 1:
+                self.assertEqual(cluster["vehicle_make"], "audi")
+
+        # Empty viewport has zero distance between clusters
+        result = self.client.get(
+            "/api/vehicles/map/?min_lat=40&max_lat=40&min_lon=40&max_lon=40&engine=numpy"
+        )
+        self.assertEqual(result.status_code, 400)
+
+    def test_js_clustering_stream(self):
+        """Test vehicles streamed from server-side cursor"""
+
+        result = self.client.get("/api/vehicles/js_clustering/?stream=1")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(json.loads(b"".join(result.streaming_content))), 50)
+
+    def test_js_clustering_columns(self):
+        """Test vehicles in compact columnar format"""
+
+        result = self.client.get(
+            "/api/vehicles/js_clustering/",
+            HTTP_ACCEPT="application/x-vehicle-columns",
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.content[:4], b"VCOL")
+        header_length = struct.unpack("<I", result.content[4:8])[0]
+        header = json.loads(result.content[8 : 8 + header_length])
+        self.assertEqual(header["count"], 50)
+        self.assertEqual(
+            sorted(header["dictionaries"]["vehicle_make"]), ["audi", "bmw"]
+        )
+
+    def test_list_cursor_pagination(self):
+        """Test walking through all pages with cursor pagination"""
+
+        ids = []
+        url = "/api/vehicles/?pagination=cursor&limit=20"
+        while url:
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+            ids += [i["service_request_number"] for i in result.json()["results"]]
+            url = result.json()["next"]
+        self.assertEqual(len(ids), 50)
+
+    def test_list_estimated_count(self):
+        """Test estimated count pagination
+
+        Small tables are counted exactly"""
+
+        result = self.client.get("/api/vehicles/?pagination=estimated")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json()["count"], 50)
+        self.assertFalse(result.json()["count_is_estimated"])
+
+    def test_map_cluster_structure(self):
+        """Test clusters built without serializer match MapVehicleSerializer output"""
+
+        result = self.client.get("/api/vehicles/map/")
+        self.assertEqual(result.status_code, 200)
+        cluster = result.json()[0]
+        self.assertEqual(
+            set(cluster),
+            {
+                "cluster",
+                "vehicles_count",
+                "vehicle_make",
+                "vehicle_color",
+                "creation_date",
+                "completion_date",
+                "type_of_service_request",
+                "location",
+            },
+        )
+        self.assertEqual(cluster["location"]["type"], "Point")
+        self.assertEqual(len(cluster["location"]["coordinates"]), 2)
+
+    def test_map_auto(self):
+        """Test map with clustering strategy selected by vehicles count"""
+
+        filter_condition = "?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        with self.settings(MAP_AUTO_STRATEGY_THRESHOLDS={"points": 0, "dbscan": 0}):
+            result = self.client.get(f"/api/vehicles/map_auto/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Strategy"], "grid")
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        with self.settings(
+            MAP_AUTO_STRATEGY_THRESHOLDS={"points": 0, "dbscan": 10**9}
+        ):
+            result = self.client.get(f"/api/vehicles/map_auto/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Strategy"], "dbscan")
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        with self.settings(
+            MAP_AUTO_STRATEGY_THRESHOLDS={"points": 10**9, "dbscan": 10**9}
+        ):
+            result = self.client.get(f"/api/vehicles/map_auto/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Strategy"], "points")
+        self.assertEqual(len(result.json()), 30)
+        self.assertEqual(result["X-Map-Engine"], "postgis")
+
+        # Clusters built in the web worker report the backend
+        with self.settings(
+            MAP_AUTO_STRATEGY_THRESHOLDS={"points": 10**9, "dbscan": 10**9}
+        ):
+            result = self.client.get(
+                f"/api/vehicles/map_auto/{filter_condition}&engine=numpy"
+            )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Strategy"], "numpy")
+        self.assertEqual(result["X-Map-Engine"], "numpy")
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+    def test_grid_cells(self):
+        """Test trigger maintained grid cells
+
+        Cells must follow inserts, updates and deletes"""
+
+        def cells_count(level=0):
+            return VehicleGridCell.objects.filter(level=level).aggregate(
+                total=Sum("vehicles_count")
+            )["total"]
+
+        self.assertEqual(cells_count(), 50)
+        self.assertEqual(cells_count(len(VehicleGridCell.CELL_SIZES) - 1), 50)
+
+        # Viewport is large enough for grid cells
+        filter_condition = "?min_lat=39.5&max_lat=40.6&min_lon=39.5&max_lon=40.6"
+        result = self.client.get(f"/api/vehicles/map_fast/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        # Viewport border crosses grid cells, vehicles outside must not be counted
+        border_condition = "?min_lat=40.03&max_lat=40.97&min_lon=40.02&max_lon=40.96"
+        result = self.client.get(f"/api/vehicles/js_clustering/{border_condition}")
+        self.assertEqual(result.status_code, 200)
+        vehicles_count = len(result.json())
+        result = self.client.get(f"/api/vehicles/map_fast/{border_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(
+            sum(i["vehicles_count"] for i in result.json()), vehicles_count
+        )
+
+        Vehicle.objects.filter(vehicle_make="bmw").delete()
+        self.assertEqual(cells_count(), 40)
+
+        # Move vehicles out of the viewport
+        Vehicle.objects.filter(completion_date=date(2022, 1, 1)).update(
+            location=Point(10, 10)
+        )
+        self.assertEqual(cells_count(), 40)
+        result = self.client.get(f"/api/vehicles/map_fast/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 10)
+
+    def test_map_geohash(self):
+        """Test map with clusters by geohash prefix
+
+        Cluster ids must not depend on the viewport position"""
+
+        result = self.client.get(
+            "/api/vehicles/map_geohash/?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+        clusters1 = {i["cluster"]: i["vehicles_count"] for i in result.json()}
+
+        result = self.client.get(
+            "/api/vehicles/map_geohash/?min_lat=39.95&max_lat=40.15&min_lon=39.95&max_lon=40.15"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+        self.assertTrue(set(clusters1) & {i["cluster"] for i in result.json()})
+
+        # Geohash is filled by database trigger
+        self.assertTrue(Vehicle.objects.filter(geohash__startswith="sz").exists())
+
+        # Cluster ids fit into JavaScript numbers for the smallest viewport
+        location = Vehicle.objects.filter(vehicle_make="audi").first().location
+        result = self.client.get(
+            "/api/vehicles/map_geohash/"
+            f"?min_lat={location.y - 1e-7}&max_lat={location.y + 1e-7}"
+            f"&min_lon={location.x - 1e-7}&max_lon={location.x + 1e-7}"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(result.json()), 1)
+        self.assertLess(result.json()[0]["cluster"], 2**53)
+
+        # Vehicles without geohash aren't backfilled yet and are skipped
+        Vehicle.objects.filter(vehicle_make="bmw").update(geohash=None)
+        result = self.client.get(
+            "/api/vehicles/map_geohash/?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 20)
+
+        result = self.client.get("/api/vehicles/")
+        self.assertNotIn("geohash", result.json()["results"][0])
+
+    def test_make_filters(self):
+        """Test case insensitive make filters"""
+
+        result = self.client.get("/api/vehicles/?vehicle_make__icontains=Ud")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json()["count"], 40)
+
+        G(Vehicle, location=Point(41, 41), vehicle_make=" Bmw ")
+        result = self.client.get("/api/vehicles/?vehicle_make_normalized=BMW")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json()["count"], 11)
+
+        # Wildcards in value are not patterns
+        result = self.client.get("/api/vehicles/?vehicle_make__icontains=%25")
+        self.assertEqual(result.json()["count"], 0)
+
+    def test_map_batch(self):
+        """Test clusters for several viewports in one request"""
+
+        viewports = [
+            {
+                "key": "a",
+                "min_lon": 40,
+                "min_lat": 40,
+                "max_lon": 40.1,
+                "max_lat": 40.1,
+            },
+            {
+                "key": "b",
+                "min_lon": 39,
+                "min_lat": 39,
+                "max_lon": 40.1,
+                "max_lat": 40.1,
+            },
+            {"key": "c", "min_lon": 10, "min_lat": 10, "max_lon": 11, "max_lat": 11},
+        ]
+        result = self.client.post(
+            "/api/vehicles/map_batch/?vehicle_make__icontains=audi",
+            {"viewports": viewports},
+            format="json",
+        )
+        self.assertEqual(result.status_code, 200)
+        counts = {
+            key: sum(i["vehicles_count"] for i in clusters)
+            for key, clusters in result.json().items()
+        }
+        self.assertEqual(counts, {"a": 20, "b": 30, "c": 0})
+
+        result = self.client.post(
+            "/api/vehicles/map_batch/",
+            {"viewports": viewports[:1] * 2},
+            format="json",
+        )
+        self.assertEqual(result.status_code, 400)
+
+    def test_map_precision(self):
+        """Test cluster coordinates rounding and compressed responses"""
+
+        filter_condition = "?min_lat=39&max_lat=42&min_lon=39&max_lon=42"
+        for engine in ["postgis", "numpy"]:
+            result = self.client.get(
+                f"/api/vehicles/map/{filter_condition}&precision=2&engine={engine}"
+            )
+            self.assertEqual(result.status_code, 200)
+            for cluster in result.json():
+                for value in cluster["location"]["coordinates"]:
+                    self.assertEqual(value, round(value, 2))
+
+        result = self.client.get(f"/api/vehicles/map/{filter_condition}&precision=a")
+        self.assertEqual(result.status_code, 400)
+
+        result = self.client.get(
+            "/api/vehicles/js_clustering/", HTTP_ACCEPT_ENCODING="gzip, deflate"
+        )
+        self.assertEqual(result["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(result.content))), 50)
+
+        # Saved bytes are shared with management command process
+        bytes_saved = len(gzip.decompress(result.content)) - len(result.content)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command("compression_stats")
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                "Compressed responses: 1",
+                f"Bytes saved: {bytes_saved}",
+                f"Average bytes saved per response: {bytes_saved}",
+            ],
+        )
+
     def test_map_filter2(self):
         """Test map with filtering #2"""
 
@@ -115,3 +447,628 @@ class GeoTestCase(APITestCase):
         clusters_count2 = len(result.json())
 
         self.assertAlmostEqual(clusters_count1, clusters_count2, delta=1)
+
+    def test_map_pyramid(self):
+        """Test map from precomputed pyramid
+
+        Pyramid must return the same vehicles count as live clustering"""
+
+        filter_condition = "?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        call_command("build_cluster_pyramid")
+
+        result = self.client.get(f"/api/vehicles/map_pyramid/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        # Not supported filter falls back to the live clustering
+        result = self.client.get(
+            f"/api/vehicles/map_pyramid/{filter_condition}&vehicle_make__icontains=bmw"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 10)
+
+        # Viewport border crosses pyramid cells, vehicles outside must not be counted
+        border_condition = "?min_lat=40.03&max_lat=40.07&min_lon=40.02&max_lon=40.06"
+        result = self.client.get(f"/api/vehicles/js_clustering/{border_condition}")
+        self.assertEqual(result.status_code, 200)
+        vehicles_count = len(result.json())
+        result = self.client.get(f"/api/vehicles/map_pyramid/{border_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(
+            sum(i["vehicles_count"] for i in result.json()), vehicles_count
+        )
+
+    def test_map_tile(self):
+        """Test vector tile with clusters"""
+
+        # Tile 8/156/96 covers all vehicles around 40, 40
+        result = self.client.get("/api/vehicles/tiles/8/156/96.mvt")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertTrue(len(result.content) > 0)
+
+        # Empty tile
+        result = self.client.get("/api/vehicles/tiles/8/0/0.mvt")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(result.content), 0)
+
+        # Tiles out of the zoom level grid
+        for tile in ["8/256/0", "8/0/256", "40/0/0"]:
+            result = self.client.get(f"/api/vehicles/tiles/{tile}.mvt")
+            self.assertEqual(result.status_code, 400)
+
+    def test_map_cache(self):
+        """Test cache for snapped viewports
+
+        Close viewports are snapped to the same grid and share cached clusters"""
+
+        get_map_cache().clear()
+        result = self.client.get(
+            "/api/vehicles/map_fast/?snap=1&min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Cache"], "MISS")
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        result = self.client.get(
+            "/api/vehicles/map_fast/?snap=1&min_lat=40.001&max_lat=40.1&min_lon=40&max_lon=40.099"
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Cache"], "HIT")
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        result = self.client.get("/api/vehicles/map_fast/")
+        self.assertEqual(result.status_code, 200)
+        self.assertFalse(result.has_header("X-Map-Cache"))
+
+    def test_map_cache_stats(self):
+        """Test cache counters are shared with management command process"""
+
+        get_map_cache().clear()
+        url = "/api/vehicles/map_fast/?snap=1&min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        for _ in range(3):
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+        # Other processes don't see cache of the server process
+        get_map_cache().clear()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            call_command("map_cache_stats")
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            ["Hits: 2", "Misses: 1", "Hit ratio: 66.7%"],
+        )
+
+    def test_conditional_get(self):
+        """Test ETag for unchanged data"""
+
+        filter_condition = "?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        for url in [
+            "/api/vehicles/",
+            "/api/vehicles/js_clustering/",
+            "/api/vehicles/map/",
+            "/api/vehicles/map_fast/",
+        ]:
+            result = self.client.get(f"{url}{filter_condition}")
+            self.assertEqual(result.status_code, 200)
+            etag = result["ETag"]
+
+            result = self.client.get(
+                f"{url}{filter_condition}", HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(result.status_code, 304)
+            self.assertEqual(result["ETag"], etag)
+            self.assertFalse(result.has_header("Last-Modified"))
+
+            # Params order doesn't matter, params values do
+            result = self.client.get(
+                f"{url}?max_lat=40.1&min_lat=40&min_lon=40&max_lon=40.1",
+                HTTP_IF_NONE_MATCH=etag,
+            )
+            self.assertEqual(result.status_code, 304)
+            result = self.client.get(
+                f"{url}{filter_condition}&vehicle_make__icontains=bmw",
+                HTTP_IF_NONE_MATCH=etag,
+            )
+            self.assertEqual(result.status_code, 200)
+
+        # Every write changes the data version
+        url = f"/api/vehicles/map/{filter_condition}"
+        etag = self.client.get(url)["ETag"]
+        Vehicle.objects.filter(vehicle_make="bmw").update(vehicle_color="Red")
+        result = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 200)
+
+        # Rebuilt pyramid changes the data version
+        url = f"/api/vehicles/map_pyramid/{filter_condition}"
+        etag = self.client.get(url)["ETag"]
+        call_command("build_cluster_pyramid")
+        result = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 200)
+
+    def test_map_cost_guard(self):
+        """Test large viewports are clusterized by grid or rejected"""
+
+        filter_condition = "?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        with self.settings(MAP_COST_GUARD_THRESHOLDS={"grid": 0, "reject": 10**9}):
+            result = self.client.get(f"/api/vehicles/map/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["X-Map-Cost-Guard"], "grid")
+        self.assertEqual(sum(i["vehicles_count"] for i in result.json()), 30)
+
+        with self.settings(MAP_COST_GUARD_THRESHOLDS={"grid": 0, "reject": 0}):
+            result = self.client.get(f"/api/vehicles/map/{filter_condition}")
+        self.assertEqual(result.status_code, 400)
+        self.assertIn("hint", result.json())
+
+        result = self.client.get(f"/api/vehicles/map/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        self.assertFalse(result.has_header("X-Map-Cost-Guard"))
+
+        # Tiles and batch viewports are guarded too
+        with self.settings(MAP_COST_GUARD_THRESHOLDS={"grid": 0, "reject": 0}):
+            result = self.client.get("/api/vehicles/tiles/8/156/96.mvt")
+            self.assertEqual(result.status_code, 400)
+            result = self.client.post(
+                "/api/vehicles/map_batch/",
+                {
+                    "viewports": [
+                        {
+                            "key": "a",
+                            "min_lon": 40,
+                            "min_lat": 40,
+                            "max_lon": 40.1,
+                            "max_lat": 40.1,
+                        }
+                    ]
+                },
+                format="json",
+            )
+            self.assertEqual(result.status_code, 400)
+
+        # Strategy and guard share one estimate
+        with mock.patch(
+            "main.views.estimate_vehicles_count", wraps=estimate_vehicles_count
+        ) as estimate:
+            result = self.client.get(f"/api/vehicles/map_auto/{filter_condition}")
+        self.assertEqual(result.status_code, 200)
+        estimate.assert_called_once()
+
+    def test_map_cost_guard_cache(self):
+        """Test cached downgraded clusters keep guard and strategy headers"""
+
+        get_map_cache().clear()
+        filter_condition = "?snap=1&min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        with self.settings(
+            MAP_COST_GUARD_THRESHOLDS={"grid": 0, "reject": 10**9},
+            MAP_AUTO_STRATEGY_THRESHOLDS={"points": 0, "dbscan": 10**9},
+        ):
+            for cache_status in ["MISS", "HIT"]:
+                result = self.client.get(f"/api/vehicles/map/{filter_condition}")
+                self.assertEqual(result.status_code, 200)
+                self.assertEqual(result["X-Map-Cache"], cache_status)
+                self.assertEqual(result["X-Map-Cost-Guard"], "grid")
+
+                result = self.client.get(f"/api/vehicles/map_auto/{filter_condition}")
+                self.assertEqual(result.status_code, 200)
+                self.assertEqual(result["X-Map-Cache"], cache_status)
+                self.assertEqual(result["X-Map-Cost-Guard"], "grid")
+                self.assertEqual(result["X-Map-Strategy"], "grid")
+
+
+class ParallelMapTestCase(APITransactionTestCase):
+    """Partitions are read in separate connections, so data must be committed."""
+
+    def setUp(self) -> None:
+        for min_lon, min_lat in [(40, 40), (40.05, 40.05), (41, 41)]:
+            for i in range(10):
+                G(
+                    Vehicle,
+                    location=Point(
+                        uniform(min_lon, min_lon + 0.01),
+                        uniform(min_lat, min_lat + 0.01),
+                    ),
+                    vehicle_make="audi",
+                )
+
+    def test_map_parallel(self):
+        """Test parallel backend clusters match database clusters"""
+
+        for filter_condition in [
+            "?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1",
+            "?min_lat=39&max_lat=42&min_lon=39&max_lon=42",
+        ]:
+            result = self.client.get(f"/api/vehicles/map/{filter_condition}")
+            self.assertEqual(result.status_code, 200)
+            postgis_clusters = result.json()
+
+            result = self.client.get(
+                f"/api/vehicles/map/{filter_condition}&engine=parallel"
+            )
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(result["X-Map-Engine"], "parallel")
+            self.assertEqual(
+                sorted(i["vehicles_count"] for i in result.json()),
+                sorted(i["vehicles_count"] for i in postgis_clusters),
+            )
+
+        # Cost guard is checked before the backend is selected
+        with self.settings(MAP_COST_GUARD_THRESHOLDS={"grid": 0, "reject": 0}):
+            result = self.client.get(
+                f"/api/vehicles/map/{filter_condition}&engine=parallel"
+            )
+        self.assertEqual(result.status_code, 400)
+
+        # Statement timeout is applied in the worker connections
+        with self.settings(MAP_STATEMENT_TIMEOUT=1):
+            with mock.patch.object(
+                VehicleMapListView,
+                "get_partition_cells_query",
+                return_value="SELECT pg_sleep(1) FROM ({sql}) q1",
+            ):
+                result = self.client.get(
+                    f"/api/vehicles/map/{filter_condition}&engine=parallel"
+                )
+        self.assertEqual(result.status_code, 400)
+        self.assertIn("hint", result.json())
+
+
+class AsyncViewsTestCase(APITransactionTestCase):
+    """Async views run sync views in database threads, so data must be committed."""
+
+    def setUp(self) -> None:
+        for i in range(10):
+            G(
+                Vehicle,
+                location=Point(uniform(40, 40.1), uniform(40, 40.1)),
+                vehicle_make="audi",
+            )
+
+    def async_get(self, url, **headers):
+        return async_to_sync(self.async_client.get)(url, **headers)
+
+    def test_async_views(self):
+        """Test async views respond as sync views"""
+
+        filter_condition = "?min_lat=40&max_lat=40.1&min_lon=40&max_lon=40.1"
+        result = self.client.get(f"/api/vehicles/{filter_condition}")
+        async_result = self.async_get(f"/api/async/vehicles/{filter_condition}")
+        self.assertEqual(async_result.status_code, 200)
+        self.assertEqual(async_result.json()["count"], result.json()["count"])
+        self.assertEqual(async_result.json()["results"], result.json()["results"])
+
+        for url in ["map/", "map_fast/"]:
+            result = self.client.get(f"/api/vehicles/{url}{filter_condition}")
+            async_result = self.async_get(
+                f"/api/async/vehicles/{url}{filter_condition}"
+            )
+            self.assertEqual(async_result.status_code, 200)
+            self.assertEqual(async_result.json(), result.json())
+            self.assertEqual(sum(i["vehicles_count"] for i in async_result.json()), 10)
+
+        # Errors are rendered in the database thread too
+        result = self.client.get(f"/api/vehicles/map/{filter_condition}&engine=bad")
+        async_result = self.async_get(
+            f"/api/async/vehicles/map/{filter_condition}&engine=bad"
+        )
+        self.assertEqual(async_result.status_code, 400)
+        self.assertEqual(async_result.json(), result.json())
+
+    def test_async_conditional_get(self):
+        """Test ETag of async views"""
+
+        for url in ["/api/async/vehicles/", "/api/async/vehicles/map/"]:
+            result = self.async_get(url)
+            self.assertEqual(result.status_code, 200)
+            result = self.async_get(url, **{"If-None-Match": result["ETag"]})
+            self.assertEqual(result.status_code, 304)
+            self.assertEqual(result.content, b"")
+
+        etag = self.async_get("/api/async/vehicles/map/")["ETag"]
+        G(Vehicle, location=Point(40.05, 40.05))
+        result = self.async_get("/api/async/vehicles/map/", **{"If-None-Match": etag})
+        self.assertEqual(result.status_code, 200)
+
+
+IMPORT_ROWS = [
+    {
+        "Creation Date": "01/02/2020",
+        "Status": "Completed",
+        "Completion Date": "01/05/2020",
+        "Service Request Number": "20-00000001",
+        "Type of Service Request": "Abandoned Vehicle Complaint",
+        "Vehicle Make/Model": "Audi",
+        "Vehicle Color": "Blue",
+        "How Many Days Has the Vehicle Been Reported as Parked?": "3",
+        "Ward": "3",
+        "Latitude": "41.85",
+        "Longitude": "-87.62",
+        "Location": "(41.85, -87.62)",
+    },
+    {
+        "Creation Date": "02/03/2020",
+        "Status": "Open",
+        "Service Request Number": "20-00000002",
+        "Type of Service Request": "Abandoned Vehicle Complaint",
+        "Vehicle Make/Model": "Bmw",
+        "Vehicle Color": "Red",
+        "Latitude": "41.9",
+        "Longitude": "-87.7",
+        "Location": "(41.9, -87.7)",
+    },
+    {
+        "Creation Date": "03/04/2020",
+        "Status": "Open",
+        "Service Request Number": "20-00000003",
+        "Type of Service Request": "Abandoned Vehicle Complaint",
+        "Vehicle Make/Model": "Ford",
+        "Street Address": "1 Main St",
+    },
+    {
+        "Creation Date": "04/05/2020",
+        "Status": "Completed",
+        "Completion Date": "04/06/2020",
+        "Service Request Number": "20-00000004",
+        "Type of Service Request": "Abandoned Vehicle Complaint",
+        "Vehicle Make/Model": "Audi",
+        "Vehicle Color": "Black",
+        "Ward": "12",
+        "Latitude": "41.8",
+        "Longitude": "-87.65",
+        "Location": "(41.8, -87.65)",
+    },
+    {
+        "Creation Date": "05/06/2020",
+        "Status": "Open",
+        "Service Request Number": "20-00000005",
+        "Type of Service Request": "Abandoned Vehicle Complaint",
+        "Vehicle Make/Model": "Kia",
+        "Vehicle Color": "White",
+        "Latitude": "41.95",
+        "Longitude": "-87.6",
+        "Location": "(41.95, -87.6)",
+    },
+]
+
+
+def write_import_file(path, rows):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(
+            file, fieldnames=list(import_rows.CSV_COLUMNS) + ["Location"]
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def get_imported_vehicles():
+    """Imported vehicle fields by service request number, location as coordinates."""
+    vehicles = Vehicle.objects.order_by("service_request_number").values(
+        *import_rows.CSV_COLUMNS.values(), "location"
+    )
+    return [
+        dict(vehicle, location=vehicle["location"] and vehicle["location"].coords)
+        for vehicle in vehicles
+    ]
+
+
+class ImportFileMixin:
+    """Use small CSV file instead of the example file in "import_rows" command."""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "example.csv")
+        write_import_file(self.path, IMPORT_ROWS)
+        patcher = mock.patch.object(import_rows, "EXAMPLE_FILE_PATH", self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ImportRowsTestCase(ImportFileMixin, TestCase):
+    """Test "import_rows" command."""
+
+    def test_import_bulk(self):
+        """Test COPY loads the same rows as get_or_create"""
+
+        call_command("import_rows")
+        vehicles = get_imported_vehicles()
+        self.assertEqual(len(vehicles), len(IMPORT_ROWS))
+        self.assertEqual(vehicles[0]["creation_date"], date(2020, 1, 2))
+        self.assertEqual(vehicles[0]["days_parked"], 3)
+        self.assertEqual(vehicles[0]["location"], (-87.62, 41.85))
+        self.assertIsNone(vehicles[2]["location"])
+
+        Vehicle.objects.all().delete()
+        call_command("import_rows", bulk=True)
+        self.assertEqual(get_imported_vehicles(), vehicles)
+
+    def test_import_chunks(self):
+        """Test file is streamed by chunks and all chunks are imported"""
+
+        chunks = import_rows.read_csv_chunks(self.path, 2)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+        call_command("import_rows", bulk=True)
+        vehicles = get_imported_vehicles()
+        for options in [{"bulk": True}, {}]:
+            Vehicle.objects.all().delete()
+            call_command("import_rows", batch_size=2, **options)
+            self.assertEqual(get_imported_vehicles(), vehicles)
+
+    def test_upsert_import(self):
+        """Test repeated upsert updates changed rows instead of duplicating them"""
+
+        call_command("import_rows", upsert=True, batch_size=2)
+        vehicles = get_imported_vehicles()
+        ids = dict(Vehicle.objects.values_list("service_request_number", "id"))
+        self.assertEqual(len(vehicles), len(IMPORT_ROWS))
+
+        call_command("import_rows", upsert=True, batch_size=2)
+        self.assertEqual(get_imported_vehicles(), vehicles)
+
+        changed_rows = [dict(row) for row in IMPORT_ROWS]
+        changed_rows[1].update({"Status": "Completed", "Completion Date": "02/10/2020"})
+        changed_rows.append(
+            dict(IMPORT_ROWS[0], **{"Service Request Number": "20-00000006"})
+        )
+        write_import_file(self.path, changed_rows)
+        call_command("import_rows", upsert=True, batch_size=2)
+
+        changed = Vehicle.objects.get(service_request_number="20-00000002")
+        self.assertEqual(changed.status, "Completed")
+        self.assertEqual(changed.completion_date, date(2020, 2, 10))
+        self.assertEqual(Vehicle.objects.count(), len(changed_rows))
+        # Existing rows keep their ids
+        self.assertEqual(
+            dict(
+                Vehicle.objects.filter(service_request_number__in=ids).values_list(
+                    "service_request_number", "id"
+                )
+            ),
+            ids,
+        )
+
+    def test_upsert_import_error(self):
+        """Test staging table is dropped when the import fails"""
+
+        command = import_rows.Command()
+        with mock.patch.object(command, "merge_staging_table", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                command.upsert_import(import_rows.read_csv_chunks(self.path, 2))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [import_rows.STAGING_TABLE])
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertFalse(Vehicle.objects.exists())
+
+    def import_failed(self, merged_chunks):
+        """Run incremental import failing after merged_chunks chunks."""
+        merge_staging_table = import_rows.Command.merge_staging_table
+        merges = []
+
+        def failing_merge(command):
+            if len(merges) == merged_chunks:
+                raise ValueError
+            merges.append(command)
+            return merge_staging_table(command)
+
+        with mock.patch.object(
+            import_rows.Command, "merge_staging_table", failing_merge
+        ):
+            with self.assertRaises(ValueError):
+                call_command("import_rows", incremental=True, batch_size=2)
+
+    def test_incremental_import(self):
+        """Test unchanged file is skipped and changes of any value are merged"""
+
+        call_command("import_rows", incremental=True, batch_size=2)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.status, ImportCheckpoint.Status.COMPLETED)
+        self.assertEqual(checkpoint.file_path, self.path)
+        self.assertEqual(checkpoint.rows_processed, len(IMPORT_ROWS))
+        self.assertEqual(checkpoint.rows_merged, len(IMPORT_ROWS))
+
+        call_command("import_rows", incremental=True, batch_size=2)
+        self.assertEqual(ImportCheckpoint.objects.count(), 1)
+
+        # Old rows without new dates are changed too
+        changed_rows = [dict(row) for row in IMPORT_ROWS]
+        changed_rows[0]["Most Recent Action"] = "Vehicle towed"
+        write_import_file(self.path, changed_rows)
+        call_command("import_rows", incremental=True, batch_size=2)
+        checkpoint = ImportCheckpoint.objects.latest("id")
+        self.assertEqual(checkpoint.status, ImportCheckpoint.Status.COMPLETED)
+        self.assertEqual(checkpoint.rows_processed, len(IMPORT_ROWS))
+        self.assertEqual(checkpoint.rows_merged, 1)
+        self.assertEqual(Vehicle.objects.count(), len(IMPORT_ROWS))
+        changed = Vehicle.objects.get(service_request_number="20-00000001")
+        self.assertEqual(changed.most_recent_action, "Vehicle towed")
+
+    def test_incremental_import_resume(self):
+        """Test failed import of the same file continues after the saved chunks"""
+
+        self.import_failed(merged_chunks=1)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.status, ImportCheckpoint.Status.RUNNING)
+        self.assertEqual(checkpoint.rows_processed, 2)
+        self.assertEqual(Vehicle.objects.count(), 2)
+
+        with mock.patch.object(
+            import_rows, "read_csv_chunks", wraps=import_rows.read_csv_chunks
+        ) as read_csv_chunks:
+            call_command("import_rows", incremental=True, batch_size=2)
+        # The first chunk isn't read again, header is kept
+        self.assertEqual(read_csv_chunks.call_args.kwargs["skiprows"], range(1, 3))
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.status, ImportCheckpoint.Status.COMPLETED)
+        self.assertEqual(checkpoint.rows_processed, len(IMPORT_ROWS))
+        self.assertEqual(checkpoint.rows_merged, len(IMPORT_ROWS))
+        self.assertEqual(Vehicle.objects.count(), len(IMPORT_ROWS))
+
+    def test_incremental_import_file_changed(self):
+        """Test failed import of the previous file version starts from the first row"""
+
+        self.import_failed(merged_chunks=1)
+        changed_rows = [dict(row) for row in IMPORT_ROWS]
+        # Rows are moved in the new file version
+        changed_rows.insert(0, changed_rows.pop())
+        changed_rows[1]["Status"] = "Open"
+        write_import_file(self.path, changed_rows)
+
+        call_command("import_rows", incremental=True, batch_size=2)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.status, ImportCheckpoint.Status.COMPLETED)
+        file_hash = import_rows.Command().get_file_hash(self.path)
+        self.assertEqual(checkpoint.file_hash, file_hash)
+        self.assertEqual(checkpoint.rows_processed, len(changed_rows))
+        # Changed first row and three not imported rows
+        self.assertEqual(checkpoint.rows_merged, 4)
+        self.assertEqual(Vehicle.objects.count(), len(changed_rows))
+        self.assertEqual(
+            Vehicle.objects.get(service_request_number="20-00000001").status, "Open"
+        )
+
+
+class ParallelImportRowsTestCase(ImportFileMixin, TransactionTestCase):
+    """Test "import_rows" with workers, they load rows with their own connections."""
+
+    def test_parallel_import(self):
+        """Test rows are loaded once and the sequence is moved after loaded ids"""
+
+        existing = G(Vehicle)
+        call_command("import_rows", workers=2, batch_size=2)
+
+        vehicles = Vehicle.objects.exclude(id=existing.id)
+        self.assertEqual(vehicles.count(), len(IMPORT_ROWS))
+        self.assertEqual(
+            sorted(vehicles.values_list("service_request_number", flat=True)),
+            [row["Service Request Number"] for row in IMPORT_ROWS],
+        )
+        # The second worker starts from the next partition
+        partition_size = Vehicle.custom_partitioned["size"]
+        ids = sorted(vehicles.values_list("id", flat=True))
+        self.assertGreater(ids[0], existing.id)
+        self.assertEqual(ids[-1] // partition_size - ids[0] // partition_size, 1)
+
+        call_command("generate_partitions")
+        self.assertGreater(G(Vehicle).id, ids[-1])
+
+    def test_reserve_ids(self):
+        """Test every worker gets ids from its own partition"""
+
+        partition_size = Vehicle.custom_partitioned["size"]
+        first_ids, last_id = import_rows.Command().reserve_ids([3, 2])
+        self.assertEqual(first_ids[1] % partition_size, 0)
+        self.assertGreaterEqual(first_ids[1], first_ids[0] + 3)
+        self.assertEqual(last_id, first_ids[1] + 1)
+
+        import_rows.Command().sync_sequence()
+        self.assertEqual(import_rows.Command().reserve_ids([1])[0], [last_id + 1])
+
+    def test_parallel_import_options(self):
+        """Test parallel import can't update existing rows"""
+
+        for option in ["upsert", "incremental"]:
+            with self.assertRaises(CommandError):
+                call_command("import_rows", workers=2, **{option: True})
+        self.assertFalse(Vehicle.objects.exists())
@@ -0,0 +1,103 @@
+import math
+
+
+def tile_bounds(z, x, y):
+    """Get (min_lon, min_lat, max_lon, max_lat) for the web mercator tile."""
+    tiles_count = 2**z
+
+    def tile_lon(tile_x):
+        return tile_x / tiles_count * 360 - 180
+
+    def tile_lat(tile_y):
+        return math.degrees(
+            math.atan(math.sinh(math.pi * (1 - 2 * tile_y / tiles_count)))
+        )
+
+    return tile_lon(x), tile_lat(y + 1), tile_lon(x + 1), tile_lat(y)
+
+
+def snap_bbox(min_lon, min_lat, max_lon, max_lat, subdivisions):
+    """Expand bbox to the grid of the zoom level which fits the bbox.
+
+    Grid step is tile size divided by subdivisions count,
+    so close viewports get the same snapped bbox.
+    """
+    span = max(max_lon - min_lon, max_lat - min_lat)
+    if span <= 0:
+        return min_lon, min_lat, max_lon, max_lat
+    zoom = max(math.floor(math.log2(360 / span)), 0)
+    step = 360 / 2**zoom / subdivisions
+    return (
+        math.floor(min_lon / step) * step,
+        math.floor(min_lat / step) * step,
+        math.ceil(max_lon / step) * step,
+        math.ceil(max_lat / step) * step,
+    )
+
+
+def split_bbox_by_cells(min_lon, min_lat, max_lon, max_lat, cell_size):
+    """Split bbox into grid cells which are completely inside it and edge strips.
+
+    Returns (min_x, max_x, min_y, max_y) inner cells range, it is empty when min > max,
+    and (min_lon, min_lat, max_lon, max_lat) strips which cover the rest of bbox.
+    Points in strips must be checked against inner cells, because strips borders are inclusive.
+    """
+    min_x = math.ceil(min_lon / cell_size)
+    max_x = math.floor(max_lon / cell_size) - 1
+    min_y = math.ceil(min_lat / cell_size)
+    max_y = math.floor(max_lat / cell_size) - 1
+    if min_x > max_x or min_y > max_y:
+        return (min_x, max_x, min_y, max_y), [(min_lon, min_lat, max_lon, max_lat)]
+
+    inner_min_lon, inner_max_lon = min_x * cell_size, (max_x + 1) * cell_size
+    inner_min_lat, inner_max_lat = min_y * cell_size, (max_y + 1) * cell_size
+    strips = [
+        (min_lon, min_lat, inner_min_lon, max_lat),
+        (inner_max_lon, min_lat, max_lon, max_lat),
+        (inner_min_lon, min_lat, inner_max_lon, inner_min_lat),
+        (inner_min_lon, inner_max_lat, inner_max_lon, max_lat),
+    ]
+    return (min_x, max_x, min_y, max_y), strips
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_cell_size(precision):
+    """Get (width, height) in degrees of the geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 360 / 2**lon_bits, 180 / 2**lat_bits
+
+
+def encode_geohash(lon, lat, precision):
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    value = 0
+    # Bits alternate starting from longitude
+    for bit in range(precision * 5):
+        coordinate, coordinate_range = (
+            (lon, lon_range) if bit % 2 == 0 else (lat, lat_range)
+        )
+        middle = (coordinate_range[0] + coordinate_range[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            coordinate_range[0] = middle
+        else:
+            coordinate_range[1] = middle
+    return "".join(
+        GEOHASH_ALPHABET[(value >> shift) & 31]
+        for shift in range((precision - 1) * 5, -1, -5)
+    )
+
+
+def geohash_to_int(geohash):
+    """Stable integer id for geohash.
+
+    Leading 1 bit keeps ids for different precisions unique.
+    """
+    value = 1
+    for char in geohash:
+        value = value << 5 | GEOHASH_ALPHABET.index(char)
+    return value
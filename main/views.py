@@ -1,10 +1,32 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 from django.contrib.gis.geos import Point, Polygon
-from django.db import connection
+from django.db import (
+    OperationalError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
 
+from rest_framework.exceptions import NotAcceptable, ValidationError
 from rest_framework.generics import ListAPIView
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+import numpy as np
+import pandas as pd
 from django_filters import rest_framework as filters
 from drf_spectacular.utils import (
     OpenApiExample,
@@ -12,41 +34,134 @@ from drf_spectacular.utils import (
     extend_schema,
     extend_schema_view,
 )
+from psycopg2.errorcodes import QUERY_CANCELED
 from silk.profiling.profiler import silk_profile
 
+from main.cache import (
+    CACHE_HITS_KEY,
+    CACHE_MISSES_KEY,
+    get_cache_key,
+    get_data_etag,
+    get_map_cache,
+    increment_counter,
+)
+from main.clustering import grid_clusters
+from main.db import estimate_vehicles_count, get_partition_ranges
 from main.filters import VehicleFilter
-from main.models import Vehicle
+from main.functions import X, Y
+from main.models import Vehicle, VehicleClusterCell, VehicleGridCell
+from main.pagination import EstimatedCountPagination, VehicleCursorPagination
+from main.renderers import ColumnarRenderer
 from main.serializers import (
+    MapBatchSerializer,
     MapVehicleSerializer,
     VehicleForJSSerializer,
     VehicleSerializer,
 )
+from main.utils import (
+    encode_geohash,
+    geohash_cell_size,
+    geohash_to_int,
+    snap_bbox,
+    split_bbox_by_cells,
+    tile_bounds,
+)
+
+CLUSTERING_BACKENDS = ["postgis", "numpy", "parallel"]
+# Integer ids of longer geohash prefixes don't fit into JavaScript numbers (2 ** 53)
+GEOHASH_MAX_PRECISION = 10
+# Vehicle information shown for clusters with one item only
+CLUSTER_ITEM_FIELDS = [
+    "vehicle_make",
+    "vehicle_color",
+    "creation_date",
+    "completion_date",
+    "type_of_service_request",
+]
+
+PAGINATION_CLASSES = {
+    "limit_offset": LimitOffsetPagination,
+    "cursor": VehicleCursorPagination,
+    "estimated": EstimatedCountPagination,
+}
+# Cluster fields except location
+CLUSTER_FIELDS = ["cluster", "vehicles_count"] + CLUSTER_ITEM_FIELDS
+COST_GUARD_HINT = "Zoom in or add filters to reduce vehicles count on the map"
+
+# Shared by all requests of the process, so "parallel" backend doesn't start threads per request
+partitions_executor = ThreadPoolExecutor(
+    max_workers=settings.MAP_PARALLEL_WORKERS,
+    thread_name_prefix="partitions",
+)
+
+
+map_parameters = [
+    OpenApiParameter(
+        "min_lat",
+        float,
+        location=OpenApiParameter.QUERY,
+        description="Southern map border",
+    ),
+    OpenApiParameter(
+        "min_lon",
+        float,
+        location=OpenApiParameter.QUERY,
+        description="Western map border",
+    ),
+    OpenApiParameter(
+        "max_lat",
+        float,
+        location=OpenApiParameter.QUERY,
+        description="Northern map border",
+    ),
+    OpenApiParameter(
+        "max_lon",
+        float,
+        location=OpenApiParameter.QUERY,
+        description="Eastern map border",
+    ),
+    OpenApiParameter(
+        "snap",
+        bool,
+        location=OpenApiParameter.QUERY,
+        description="Snap map borders to the grid and cache clusters",
+    ),
+]
 
 map_schema = extend_schema(
-    parameters=[
+    parameters=map_parameters
+    + [
         OpenApiParameter(
-            "min_lat",
-            float,
+            "engine",
+            str,
             location=OpenApiParameter.QUERY,
-            description="Southern map border",
+            enum=CLUSTERING_BACKENDS,
+            description="Clustering backend, database or web worker",
         ),
         OpenApiParameter(
-            "min_lon",
-            float,
+            "precision",
+            int,
             location=OpenApiParameter.QUERY,
-            description="Western map border",
+            description="Digits after decimal point in cluster coordinates, by default depends on the map size",
         ),
+    ],
+)
+
+js_clustering_schema = extend_schema(
+    parameters=map_parameters
+    + [
         OpenApiParameter(
-            "max_lat",
-            float,
+            "stream",
+            bool,
             location=OpenApiParameter.QUERY,
-            description="Northern map border",
+            description="Stream vehicles from server-side cursor",
         ),
         OpenApiParameter(
-            "max_lon",
-            float,
+            "coords",
+            str,
             location=OpenApiParameter.QUERY,
-            description="Eastern map border",
+            enum=["float32", "int32"],
+            description="Coordinates type for columnar format",
         ),
     ],
 )
@@ -81,7 +196,61 @@ map_example = OpenApiExample(
 )
 
 
-class VehicleListView(ListAPIView):
+def point_geojson(lon, lat):
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+class DataVersionConditionalMixin:
+    """Answer conditional GET without queries to the vehicles when data isn't changed.
+
+    ETag is built from the data version and normalized query params.
+    Last-Modified isn't sent, because its one second resolution can hide changes.
+    """
+
+    def get_validators_params(self, request):
+        return {
+            "query": sorted(request.query_params.lists()),
+            "accept": request.META.get("HTTP_ACCEPT", ""),
+            "kwargs": self.kwargs,
+        }
+
+    def get(self, request, *args, **kwargs):
+        etag = get_data_etag(
+            self.__class__.__name__, self.get_validators_params(request)
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if not response.has_header("Cache-Control"):
+                # Clients and proxies have to revalidate cached responses
+                patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ("Accept",))
+        response["ETag"] = etag
+        return response
+
+
+@extend_schema_view(
+    get=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "pagination",
+                str,
+                location=OpenApiParameter.QUERY,
+                enum=list(PAGINATION_CLASSES),
+                description="Pagination mode, cursor is recommended for deep pages",
+            ),
+            OpenApiParameter(
+                "cursor",
+                str,
+                location=OpenApiParameter.QUERY,
+                description="Cursor from the previous page for cursor pagination",
+            ),
+        ],
+    ),
+)
+class VehicleListView(DataVersionConditionalMixin, ListAPIView):
     """Paginated list view for showing all."""
 
     serializer_class = VehicleSerializer
@@ -89,14 +258,28 @@ class VehicleListView(ListAPIView):
     filterset_class = VehicleFilter
     queryset = Vehicle.objects.all()
 
+    @property
+    def paginator(self):
+        """Pagination class is selected by "pagination" query parameter."""
+        if not hasattr(self, "_paginator"):
+            pagination = self.request.query_params.get("pagination")
+            if pagination and pagination not in PAGINATION_CLASSES:
+                raise ValidationError(
+                    {"pagination": f"Choose one of {list(PAGINATION_CLASSES)}"}
+                )
+            pagination_class = PAGINATION_CLASSES.get(pagination, self.pagination_class)
+            self._paginator = pagination_class()
+        return self._paginator
+
 
-class BaseMapListView(ListAPIView):
+class BaseMapListView(DataVersionConditionalMixin, ListAPIView):
     queryset = Vehicle.objects.all()
     filter_backends = [filters.DjangoFilterBackend]
     filterset_class = VehicleFilter
 
     # Map options for filtering and clustering
     polygon = None
+    bbox = None
     max_distance_between_objects = None
     grid_cell_size = None
 
@@ -108,6 +291,21 @@ class BaseMapListView(ListAPIView):
         min_lat = float(request.query_params.get("min_lat", -180))
         max_lon = float(request.query_params.get("max_lon", 90))
         min_lon = float(request.query_params.get("min_lon", -90))
+        if self.snap_enabled(request):
+            min_lon, min_lat, max_lon, max_lat = snap_bbox(
+                min_lon,
+                min_lat,
+                max_lon,
+                max_lat,
+                settings.MAP_SNAP_SUBDIVISIONS,
+            )
+        self.set_bbox(min_lon, min_lat, max_lon, max_lat)
+
+    def snap_enabled(self, request):
+        return request.query_params.get("snap") in ("1", "true")
+
+    def set_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        self.bbox = (min_lon, min_lat, max_lon, max_lat)
         self.polygon = Polygon(
             [
                 (min_lon, min_lat),
@@ -127,6 +325,14 @@ class BaseMapListView(ListAPIView):
             / settings.MAP_GRID_CELL_COUNT
         )
 
+    def has_filters(self, exclude=()):
+        """Check if request has any VehicleFilter params except excluded."""
+        return any(
+            self.request.query_params.get(name)
+            for name in self.filterset_class.base_filters
+            if name not in exclude
+        )
+
     def get_queryset(self):
         self.set_map_options(self.request)
         queryset = super().get_queryset()
@@ -142,20 +348,101 @@ class BaseMapListView(ListAPIView):
     list=extend_schema(
         examples=[map_example],
     ),
-    get=map_schema,
+    get=js_clustering_schema,
 )
 class VehicleNotPaginatedListView(BaseMapListView):
     """Not paginated list view for js clustering"""
 
     serializer_class = VehicleForJSSerializer
     pagination_class = None
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarRenderer]
+
+    # Dictionary encoded columns
+    dictionary_columns = ["vehicle_make", "vehicle_color", "type_of_service_request"]
+    date_columns = ["creation_date", "completion_date"]
+    # Stored instead of null dates
+    null_date = np.iinfo(np.int32).min
+    # Degrees per unit for quantized int32 coordinates
+    coordinates_scale = 1e-7
 
     @silk_profile(name="Not paginated list")
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        if isinstance(request.accepted_renderer, ColumnarRenderer):
+            return Response(self.get_columns(queryset))
+        if request.query_params.get("stream") in ("1", "true"):
+            return self.stream_list(queryset)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    def get_columns(self, queryset):
+        """Get vehicles as typed arrays straight from the database rows."""
+        rows = queryset.annotate(
+            lon=X("location"),
+            lat=Y("location"),
+        ).values_list("lon", "lat", *self.dictionary_columns, *self.date_columns)
+        df = pd.DataFrame.from_records(
+            rows,
+            columns=["lon", "lat", *self.dictionary_columns, *self.date_columns],
+        )
+
+        columns = {}
+        meta = {"null_date": int(self.null_date)}
+        if self.request.query_params.get("coords") == "int32":
+            meta["coordinates_scale"] = self.coordinates_scale
+            for name in ["lon", "lat"]:
+                columns[name] = np.rint(
+                    df[name].to_numpy(dtype=np.float64) / self.coordinates_scale
+                ).astype(np.int32)
+        else:
+            for name in ["lon", "lat"]:
+                columns[name] = df[name].to_numpy(dtype=np.float32)
+
+        # Values are replaced with indexes in the dictionary, -1 for null
+        dictionaries = {}
+        for name in self.dictionary_columns:
+            codes, uniques = pd.factorize(df[name])
+            dtype = np.int16 if len(uniques) < np.iinfo(np.int16).max else np.int32
+            columns[name] = codes.astype(dtype)
+            dictionaries[name] = uniques.tolist()
+
+        # Dates are stored as days since 1970-01-01
+        for name in self.date_columns:
+            days = (pd.to_datetime(df[name]) - pd.Timestamp(0)).dt.days
+            columns[name] = days.fillna(self.null_date).to_numpy(dtype=np.int32)
+
+        return {
+            "count": len(df),
+            "columns": columns,
+            "dictionaries": dictionaries,
+            "meta": meta,
+        }
+
+    def render_chunk(self, vehicles):
+        """Render vehicles as JSON array items without brackets."""
+        serializer = self.get_serializer(vehicles, many=True)
+        return JSONRenderer().render(serializer.data)[1:-1]
+
+    def stream_list(self, queryset):
+        """Stream JSON array, so only one chunk of vehicles is kept in memory."""
+        chunk_size = settings.MAP_STREAM_CHUNK_SIZE
+
+        def stream():
+            yield b"["
+            separator = b""
+            vehicles = []
+            for vehicle in queryset.iterator(chunk_size=chunk_size):
+                vehicles.append(vehicle)
+                if len(vehicles) == chunk_size:
+                    yield separator + self.render_chunk(vehicles)
+                    separator = b","
+                    vehicles = []
+            if vehicles:
+                yield separator + self.render_chunk(vehicles)
+            yield b"]"
+
+        return StreamingHttpResponse(stream(), content_type="application/json")
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -173,6 +460,17 @@ class VehicleMapListView(BaseMapListView):
     serializer_class = MapVehicleSerializer
     pagination_class = None
     queryset = Vehicle.objects.all()
+    # Columns copied from the clusters query as is
+    cluster_fields = CLUSTER_FIELDS
+    # Replace clustering query with grid + DBSCAN when too many vehicles are estimated
+    cost_guard_downgrade = True
+    downgraded = False
+    # Backend which clusterized the response
+    engine = None
+    # Attributes set by clustering, they are cached with clusters for the response headers
+    cached_state_fields = ["engine", "downgraded"]
+    # Planner estimate of vehicles count, it is calculated once per request
+    estimated_count = None
 
     def get_map_query(self):
         return """
@@ -230,7 +528,7 @@ class VehicleMapListView(BaseMapListView):
             INNER JOIN t2 ON t1.cluster=t2.cluster
         """
 
-    def clusterize(self, queryset):
+    def get_map_sql(self, queryset):
         query = queryset.values(
             "location",
             "vehicle_color",
@@ -241,31 +539,484 @@ class VehicleMapListView(BaseMapListView):
         ).query
         sql, params = query.sql_with_params()
 
-        map_query = self.get_map_query().format(
+        if self.downgraded:
+            map_query = VehicleMapLargeCountListView.get_map_query(self)
+        else:
+            map_query = self.get_map_query()
+        map_query = map_query.format(
             sql=sql,
             self=self,
         )
-        with connection.cursor() as cursor:
-            cursor.execute(map_query, params)
-            columns = [col[0] for col in cursor.description]
-            data = []
-            for row in cursor.fetchall():
-                data_item = dict(zip(columns, row))
-                data_item["location"] = Point(
-                    data_item.pop("lon"),
-                    data_item.pop("lat"),
+        return map_query, params
+
+    def get_coordinates_precision(self):
+        """Digits kept in cluster coordinates.
+
+        By default rounding error is 10 times less than grid cell size, so it isn't visible on the map.
+        """
+        precision = self.request.query_params.get("precision")
+        if precision is None:
+            if self.grid_cell_size <= 0:
+                return settings.MAP_MAX_COORDINATES_PRECISION
+            precision = math.ceil(-math.log10(self.grid_cell_size / 10))
+            return min(max(precision, 0), settings.MAP_MAX_COORDINATES_PRECISION)
+        try:
+            precision = int(precision)
+        except ValueError:
+            precision = -1
+        if not 0 <= precision <= settings.MAP_MAX_COORDINATES_PRECISION:
+            raise ValidationError(
+                {
+                    "precision": f"Integer from 0 to {settings.MAP_MAX_COORDINATES_PRECISION} expected"
+                }
+            )
+        return precision
+
+    def get_clustering_backend(self):
+        backend = self.request.query_params.get(
+            "engine", settings.MAP_CLUSTERING_BACKEND
+        )
+        if backend not in CLUSTERING_BACKENDS:
+            raise ValidationError({"engine": f"Choose one of {CLUSTERING_BACKENDS}"})
+        return backend
+
+    def get_clustering_distance(self):
+        """Distance between clusters for clustering in the web worker, it is 0 for empty viewport."""
+        if not self.max_distance_between_objects > 0:
+            raise ValidationError(
+                {"detail": "Viewport must have positive width or height"}
+            )
+        return self.max_distance_between_objects
+
+    def get_estimated_count(self, queryset):
+        if self.estimated_count is None:
+            self.estimated_count = estimate_vehicles_count(queryset)
+        return self.estimated_count
+
+    def check_query_cost(self, queryset):
+        """Pre-flight guard against runaway clustering queries.
+
+        Vehicles count is estimated by the planner, so the guard is cheap even for large viewports.
+        """
+        estimated_count = self.get_estimated_count(queryset)
+        thresholds = settings.MAP_COST_GUARD_THRESHOLDS
+        if estimated_count > thresholds["reject"]:
+            raise ValidationError(
+                {
+                    "detail": f"About {estimated_count} vehicles are too many to clusterize",
+                    "hint": COST_GUARD_HINT,
+                }
+            )
+        self.downgraded = (
+            self.cost_guard_downgrade and estimated_count > thresholds["grid"]
+        )
+
+    def clusterize(self, queryset):
+        self.check_query_cost(queryset)
+        backend = self.get_clustering_backend()
+        # Downgraded query is always clusterized in the database
+        self.engine = "postgis" if self.downgraded else backend
+        if self.engine == "numpy":
+            return self.clusterize_numpy(queryset)
+        if self.engine == "parallel":
+            return self.clusterize_parallel(queryset)
+        map_query, params = self.get_map_sql(queryset)
+        return self.fetch_clusters(map_query, params)
+
+    def get_partition_cells_query(self):
+        return """
+            -- Partial grid aggregates for one partition
+            SELECT floor(ST_X(location) / {self.grid_cell_size})::bigint AS cell_x,
+                floor(ST_Y(location) / {self.grid_cell_size})::bigint AS cell_y,
+                count(*) AS vehicles_count,
+                sum(ST_X(location)) AS lon_sum,
+                sum(ST_Y(location)) AS lat_sum,
+                CASE WHEN count(*) = 1 THEN max(vehicle_make) END AS vehicle_make,
+                CASE WHEN count(*) = 1 THEN max(vehicle_color) END AS vehicle_color,
+                CASE WHEN count(*) = 1 THEN max(creation_date) END AS creation_date,
+                CASE WHEN count(*) = 1 THEN max(completion_date) END AS completion_date,
+                CASE WHEN count(*) = 1 THEN max(type_of_service_request) END
+                    AS type_of_service_request
+            FROM ({sql}) q1
+            GROUP BY 1, 2
+        """
+
+    def fetch_partition_cells(self, queryset):
+        """Runs in the worker thread with its own database connection.
+
+        Connection is kept for the next requests according to CONN_MAX_AGE.
+        """
+        close_old_connections()
+        try:
+            sql, params = queryset.values(
+                "location", *CLUSTER_ITEM_FIELDS
+            ).query.sql_with_params()
+            _, rows = self.execute_map_query(
+                self.get_partition_cells_query().format(sql=sql, self=self), params
+            )
+            return rows
+        finally:
+            close_old_connections()
+
+    def clusterize_parallel(self, queryset):
+        """Aggregate partitions concurrently and merge partial results.
+
+        Every partition is grouped by grid cells in a separate connection,
+        cells from all partitions are merged and clustered in the web worker.
+        Worker threads don't see uncommitted changes of the request transaction.
+        """
+        partition_querysets = [
+            queryset.filter(id__gte=start, id__lt=end)
+            for start, end in get_partition_ranges(Vehicle)
+        ]
+        rows = [
+            row
+            for partition_rows in partitions_executor.map(
+                self.fetch_partition_cells, partition_querysets
+            )
+            for row in partition_rows
+        ]
+        if not rows:
+            return []
+
+        # Merge the same cells from different partitions
+        cells = np.array([row[:5] for row in rows], dtype=np.float64)
+        _, cell_index = np.unique(cells[:, :2], axis=0, return_inverse=True)
+        cell_counts = np.bincount(cell_index, weights=cells[:, 2])
+        cell_lon = np.bincount(cell_index, weights=cells[:, 3]) / cell_counts
+        cell_lat = np.bincount(cell_index, weights=cells[:, 4]) / cell_counts
+
+        # Cluster cell centers, cluster sums are weighted by vehicles count
+        cell_labels = grid_clusters(cell_lon, cell_lat, self.get_clustering_distance())
+        counts = np.bincount(cell_labels, weights=cell_counts)
+        lon_centers = np.bincount(cell_labels, weights=cell_lon * cell_counts) / counts
+        lat_centers = np.bincount(cell_labels, weights=cell_lat * cell_counts) / counts
+        precision = self.get_coordinates_precision()
+        lon_centers = np.round(lon_centers, precision)
+        lat_centers = np.round(lat_centers, precision)
+
+        # Single vehicle clusters have one partial row with the vehicle information
+        single_rows = {
+            int(cell_labels[cell_index[row_index]]): row
+            for row_index, row in enumerate(rows)
+            if counts[cell_labels[cell_index[row_index]]] == 1
+        }
+
+        data = []
+        for cluster, vehicles_count in enumerate(counts.tolist()):
+            data_item = {
+                "cluster": cluster,
+                "vehicles_count": int(vehicles_count),
+                "location": point_geojson(
+                    float(lon_centers[cluster]),
+                    float(lat_centers[cluster]),
+                ),
+            }
+            row = single_rows.get(cluster)
+            for field_index, field in enumerate(CLUSTER_ITEM_FIELDS, 5):
+                data_item[field] = row[field_index] if row else None
+            data.append(data_item)
+        return data
+
+    def clusterize_numpy(self, queryset):
+        """Cluster locations in the web worker instead of the database.
+
+        Only ids and coordinates are fetched for all vehicles,
+        additional information is fetched for clusters with one item only.
+        """
+        rows = queryset.annotate(
+            lon=X("location"),
+            lat=Y("location"),
+        ).values_list("id", "lon", "lat")
+        points = np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+        ids, lon, lat = points[:, 0].astype(np.int64), points[:, 1], points[:, 2]
+
+        labels = grid_clusters(lon, lat, self.get_clustering_distance())
+        counts = np.bincount(labels)
+        lon_centers = np.bincount(labels, weights=lon) / np.maximum(counts, 1)
+        lat_centers = np.bincount(labels, weights=lat) / np.maximum(counts, 1)
+        precision = self.get_coordinates_precision()
+        lon_centers = np.round(lon_centers, precision)
+        lat_centers = np.round(lat_centers, precision)
+
+        single_ids = ids[counts[labels] == 1]
+        single_vehicles = {
+            vehicle.pop("id"): vehicle
+            for vehicle in Vehicle.objects.filter(id__in=single_ids.tolist()).values(
+                "id", *CLUSTER_ITEM_FIELDS
+            )
+        }
+        single_clusters = dict(
+            zip(labels[counts[labels] == 1].tolist(), single_ids.tolist())
+        )
+
+        data = []
+        for cluster, vehicles_count in enumerate(counts.tolist()):
+            data_item = {
+                "cluster": cluster,
+                "vehicles_count": vehicles_count,
+                "location": point_geojson(
+                    float(lon_centers[cluster]),
+                    float(lat_centers[cluster]),
+                ),
+            }
+            vehicle = single_vehicles.get(single_clusters.get(cluster), {})
+            for field in CLUSTER_ITEM_FIELDS:
+                data_item[field] = vehicle.get(field)
+            data.append(data_item)
+        return data
+
+    def get_cache_params(self):
+        """Normalized filters and snapped bbox."""
+        params = {
+            name: self.request.query_params.getlist(name)
+            for name in self.filterset_class.base_filters
+            if self.request.query_params.get(name)
+        }
+        params["bbox"] = [round(value, 9) for value in self.bbox]
+        params["engine"] = self.get_clustering_backend()
+        params["precision"] = self.get_coordinates_precision()
+        return params
+
+    def get_cached_clusters(self, queryset):
+        """Clusterize with cache for snapped viewports.
+
+        Returns clusters and cache status. Clustering state is cached with clusters
+        and restored on hit, so headers of cached response are the same.
+        """
+        if not self.snap_enabled(self.request):
+            return self.clusterize(queryset), None
+        cache = get_map_cache()
+        key = get_cache_key(self.__class__.__name__, self.get_cache_params())
+        cached = cache.get(key)
+        if cached is not None:
+            increment_counter(CACHE_HITS_KEY)
+            data, state = cached
+            for name, value in state.items():
+                setattr(self, name, value)
+            return data, "HIT"
+        increment_counter(CACHE_MISSES_KEY)
+        data = self.clusterize(queryset)
+        state = {name: getattr(self, name) for name in self.cached_state_fields}
+        cache.set(key, (data, state))
+        return data, "MISS"
+
+    def execute_map_query(self, map_query, params):
+        """Run map query with MAP_STATEMENT_TIMEOUT and return column names and rows."""
+        try:
+            # Local timeout ends with the transaction, so the connection isn't affected
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = %s",
+                    [settings.MAP_STATEMENT_TIMEOUT],
                 )
-                data.append(data_item)
+                cursor.execute(map_query, params)
+                columns = [col[0] for col in cursor.description]
+                return columns, cursor.fetchall()
+        except OperationalError as e:
+            if getattr(e.__cause__, "pgcode", None) != QUERY_CANCELED:
+                raise
+            raise ValidationError(
+                {
+                    "detail": "Map query was cancelled by statement timeout",
+                    "hint": COST_GUARD_HINT,
+                }
+            )
+
+    def fetch_clusters(self, map_query, params):
+        """Convert cursor rows straight to the MapVehicleSerializer output structure.
+
+        Cluster coordinates are rounded in the database.
+        """
+        precision = self.get_coordinates_precision()
+        map_query = f"""
+            SELECT clusters.*,
+                round(clusters.lon::numeric, {precision})::float8 AS rounded_lon,
+                round(clusters.lat::numeric, {precision})::float8 AS rounded_lat
+            FROM ({map_query}) clusters
+        """
+        columns, rows = self.execute_map_query(map_query, params)
+        lon_index = columns.index("rounded_lon")
+        lat_index = columns.index("rounded_lat")
+        fields = [
+            (index, name)
+            for index, name in enumerate(columns)
+            if name in self.cluster_fields
+        ]
+        data = []
+        for row in rows:
+            data_item = {name: row[index] for index, name in fields}
+            data_item["location"] = point_geojson(row[lon_index], row[lat_index])
+            data.append(data_item)
         return data
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        result_data = self.clusterize(queryset)
-        serializer = self.serializer_class(result_data, many=True)
-        return Response(serializer.data)
+        result_data, cache_status = self.get_cached_clusters(queryset)
+        # Clusters are already in the serializer output structure
+        return Response(result_data, headers=self.get_map_headers(cache_status))
+
+    def get_map_headers(self, cache_status):
+        headers = {}
+        if cache_status:
+            headers["X-Map-Cache"] = cache_status
+        if self.downgraded:
+            headers["X-Map-Cost-Guard"] = "grid"
+        if self.engine:
+            headers["X-Map-Engine"] = self.engine
+        return headers
 
 
 class VehicleMapLargeCountListView(VehicleMapListView):
+    def get_grid_cells_query(self):
+        return """
+            -- Trigger maintained grid cells completely inside the viewport
+            WITH viewport_cells AS
+            (SELECT cell_x,
+                    cell_y,
+                    vehicles_count,
+                    lon_sum,
+                    lat_sum
+            FROM {table_name}
+            WHERE level = %(level)s
+                AND cell_x BETWEEN %(min_x)s AND %(max_x)s
+                AND cell_y BETWEEN %(min_y)s AND %(max_y)s
+            UNION ALL
+            -- Edge cells are partially outside the viewport, so only vehicles in the viewport are aggregated
+            SELECT floor(ST_X(location) / %(cell_size)s)::integer AS cell_x,
+                floor(ST_Y(location) / %(cell_size)s)::integer AS cell_y,
+                count(*) AS vehicles_count,
+                sum(ST_X(location)) AS lon_sum,
+                sum(ST_Y(location)) AS lat_sum
+            FROM {vehicle_table}
+            WHERE ({strips_condition})
+                AND NOT (
+                    floor(ST_X(location) / %(cell_size)s)::integer BETWEEN %(min_x)s AND %(max_x)s
+                    AND floor(ST_Y(location) / %(cell_size)s)::integer BETWEEN %(min_y)s AND %(max_y)s
+                )
+            GROUP BY 1, 2),
+            -- Cell centers
+                cells AS
+            (SELECT viewport_cells.*,
+                    ST_SetSRID(
+                        ST_MakePoint(lon_sum / vehicles_count, lat_sum / vehicles_count),
+                        4326
+                    ) AS center
+            FROM viewport_cells),
+            -- Calculate clusters for cell centers
+                clustered_cells AS
+            (SELECT cells.*,
+                    ST_ClusterDBScan(center, {self.max_distance_between_objects}, 1) over() AS cluster
+            FROM cells),
+                t1 AS
+            (SELECT cluster,
+                    sum(lon_sum) / sum(vehicles_count) AS lon,
+                    sum(lat_sum) / sum(vehicles_count) AS lat,
+                    sum(vehicles_count)::bigint AS vehicles_count,
+                    min(cell_x) AS cell_x,
+                    min(cell_y) AS cell_y
+            FROM clustered_cells
+            GROUP BY cluster)
+            -- Additional information for clusters with one item only, such cluster has one cell
+            SELECT t1.cluster,
+                t1.lon,
+                t1.lat,
+                t1.vehicles_count,
+                t2.vehicle_make,
+                t2.vehicle_color,
+                t2.creation_date,
+                t2.completion_date,
+                t2.type_of_service_request
+            FROM t1
+            LEFT JOIN LATERAL
+            (SELECT vehicle_make,
+                    vehicle_color,
+                    creation_date,
+                    completion_date,
+                    type_of_service_request
+            FROM {vehicle_table}
+            WHERE t1.vehicles_count = 1
+                AND location && ST_MakeEnvelope(
+                    t1.cell_x * %(cell_size)s,
+                    t1.cell_y * %(cell_size)s,
+                    (t1.cell_x + 1) * %(cell_size)s,
+                    (t1.cell_y + 1) * %(cell_size)s,
+                    4326
+                )
+                -- Envelopes are inclusive, vehicles on the border of neighbour cell or viewport are skipped
+                AND floor(ST_X(location) / %(cell_size)s)::integer = t1.cell_x
+                AND floor(ST_Y(location) / %(cell_size)s)::integer = t1.cell_y
+                AND location && ST_MakeEnvelope(
+                    %(min_lon)s, %(min_lat)s, %(max_lon)s, %(max_lat)s, 4326
+                )
+            LIMIT 1) t2 ON true
+        """
+
+    def get_cells_split(self, cell_size):
+        """Get params for grid cells inside the viewport and condition for vehicles in edge strips.
+
+        Params contain "cell_size" and inner cells range "min_x", "max_x", "min_y", "max_y".
+        """
+        (min_x, max_x, min_y, max_y), strips = split_bbox_by_cells(
+            *self.bbox, cell_size
+        )
+        params = {
+            "cell_size": cell_size,
+            "min_x": min_x,
+            "max_x": max_x,
+            "min_y": min_y,
+            "max_y": max_y,
+        }
+        conditions = []
+        for index, strip in enumerate(strips):
+            names = [f"strip_{index}_{bound}" for bound in range(4)]
+            params.update(zip(names, strip))
+            conditions.append(
+                "location && ST_MakeEnvelope(%({})s, %({})s, %({})s, %({})s, 4326)".format(
+                    *names
+                )
+            )
+        return params, " OR ".join(conditions)
+
+    def get_grid_level(self):
+        """Get the largest grid cells level which is not larger than grid cell size."""
+        levels = [
+            level
+            for level, cell_size in enumerate(VehicleGridCell.CELL_SIZES)
+            if cell_size <= self.grid_cell_size
+        ]
+        return max(levels, key=VehicleGridCell.CELL_SIZES.__getitem__, default=None)
+
+    def clusterize(self, queryset):
+        """Clusterize unfiltered vehicles from grid cells aggregates."""
+        level = self.get_grid_level()
+        if (
+            level is None
+            or self.has_filters()
+            or self.get_clustering_backend() != "postgis"
+        ):
+            return super().clusterize(queryset)
+
+        self.engine = "postgis"
+        params, strips_condition = self.get_cells_split(
+            VehicleGridCell.CELL_SIZES[level]
+        )
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        params.update(
+            level=level,
+            min_lon=min_lon,
+            min_lat=min_lat,
+            max_lon=max_lon,
+            max_lat=max_lat,
+        )
+        grid_cells_query = self.get_grid_cells_query().format(
+            table_name=VehicleGridCell._meta.db_table,
+            vehicle_table=Vehicle._meta.db_table,
+            strips_condition=strips_condition,
+            self=self,
+        )
+        return self.fetch_clusters(grid_cells_query, params)
+
     def get_map_query(self):
         return """
             -- Snap to grid every location in the database
@@ -332,3 +1083,520 @@ class VehicleMapLargeCountListView(VehicleMapListView):
             FROM t1
             INNER JOIN t2 ON t1.cluster=t2.cluster
             """
+
+
+class VehicleMapBatchView(VehicleMapListView):
+    """Clusters for several viewports with shared filters in one query.
+
+    Filters are passed in query string and viewports in request body, for example
+    POST http://localhost:8000/api/vehicles/map_batch/?vehicle_make__icontains=Bmw
+    {"viewports": [{"key": "ward-1", "min_lon": -87.7, "min_lat": 41.84, "max_lon": -87.6, "max_lat": 41.85}]}
+
+    Response contains clusters list for every viewport key.
+    """
+
+    http_method_names = ["post", "options"]
+    serializer_class = MapBatchSerializer
+    cluster_fields = ["viewport"] + CLUSTER_FIELDS
+    viewports = None
+
+    def get_batch_query(self):
+        return """
+            -- Viewports with their grid cell size and clustering distance
+            WITH viewports(viewport, polygon, grid_cell_size, max_distance) AS
+            (VALUES {values}),
+            -- Filtered vehicles are read once and joined to every viewport which covers them
+                rounded_locations AS
+            (SELECT viewports.viewport,
+                    viewports.max_distance,
+                    ST_SnapToGrid(q1.location, viewports.grid_cell_size) AS grid_location,
+                    q1.vehicle_color,
+                    q1.vehicle_make,
+                    q1.creation_date,
+                    q1.completion_date,
+                    q1.type_of_service_request,
+                    q1.location
+            FROM viewports
+            INNER JOIN ({sql}) q1 ON ST_CoveredBy(q1.location, viewports.polygon)),
+            -- Calculate clusters for grid locations of every viewport separately
+                clusters_tmp AS
+            (SELECT viewport,
+                    grid_location,
+                    ST_ClusterDBScan(grid_location, max_distance, 1) over(PARTITION BY viewport) AS cluster
+            FROM
+                (SELECT DISTINCT viewport, max_distance, grid_location
+                FROM rounded_locations) grid_points ),
+                clustered_locations AS
+            (SELECT rounded_locations.*,
+                    clusters_tmp.cluster
+            FROM rounded_locations
+            INNER JOIN clusters_tmp ON clusters_tmp.viewport = rounded_locations.viewport
+                AND clusters_tmp.grid_location = rounded_locations.grid_location),
+                t1 AS
+            (SELECT viewport,
+                    cluster,
+                    avg(ST_X(location)) as lon,
+                    avg(ST_Y(location)) as lat,
+                    count(*) AS vehicles_count
+            FROM clustered_locations
+            GROUP BY viewport, cluster),
+                t2 AS
+            (SELECT DISTINCT ON (viewport, cluster) vehicle_color,
+                                vehicle_make,
+                                creation_date,
+                                completion_date,
+                                type_of_service_request,
+                                viewport,
+                                cluster
+            FROM clustered_locations)
+            SELECT t1.*,
+                CASE
+                    WHEN t1.vehicles_count = 1 THEN t2.vehicle_make
+                    ELSE NULL
+                END AS vehicle_make,
+                CASE
+                    WHEN t1.vehicles_count = 1 THEN t2.vehicle_color
+                    ELSE NULL
+                END AS vehicle_color,
+                CASE
+                    WHEN t1.vehicles_count = 1 THEN t2.creation_date
+                    ELSE NULL
+                END AS creation_date,
+                CASE
+                    WHEN t1.vehicles_count = 1 THEN t2.completion_date
+                    ELSE NULL
+                END AS completion_date,
+                CASE
+                    WHEN t1.vehicles_count = 1 THEN t2.type_of_service_request
+                    ELSE NULL
+                END AS type_of_service_request
+            FROM t1
+            INNER JOIN t2 ON t1.viewport = t2.viewport AND t1.cluster = t2.cluster
+        """
+
+    def set_map_options(self, request):
+        """Use the extent of all viewports to prefilter vehicles."""
+        self.set_bbox(
+            min(viewport["min_lon"] for viewport in self.viewports),
+            min(viewport["min_lat"] for viewport in self.viewports),
+            max(viewport["max_lon"] for viewport in self.viewports),
+            max(viewport["max_lat"] for viewport in self.viewports),
+        )
+
+    def get_batch_sql(self, queryset):
+        values = []
+        params = []
+        grid_cell_sizes = []
+        for viewport in self.viewports:
+            self.set_bbox(
+                viewport["min_lon"],
+                viewport["min_lat"],
+                viewport["max_lon"],
+                viewport["max_lat"],
+            )
+            values.append(
+                "(%s, ST_MakeEnvelope(%s, %s, %s, %s, 4326), %s::float8, %s::float8)"
+            )
+            params += [
+                viewport["key"],
+                *self.bbox,
+                self.grid_cell_size,
+                self.max_distance_between_objects,
+            ]
+            grid_cell_sizes.append(self.grid_cell_size)
+        # Coordinates precision follows the smallest viewport
+        self.grid_cell_size = min(grid_cell_sizes)
+
+        sql, sql_params = queryset.values(
+            "location",
+            "vehicle_color",
+            "vehicle_make",
+            "creation_date",
+            "completion_date",
+            "type_of_service_request",
+        ).query.sql_with_params()
+        batch_query = self.get_batch_query().format(values=", ".join(values), sql=sql)
+        return batch_query, params + list(sql_params)
+
+    @extend_schema(request=MapBatchSerializer, responses={200: dict})
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.viewports = serializer.validated_data["viewports"]
+
+        queryset = self.get_queryset()
+        # Batch query is already grid + DBSCAN, so the guard can only reject it
+        self.check_query_cost(queryset)
+        batch_query, params = self.get_batch_sql(queryset)
+        result_data = {viewport["key"]: [] for viewport in self.viewports}
+        for data_item in self.fetch_clusters(batch_query, params):
+            result_data[data_item.pop("viewport")].append(data_item)
+        return Response(result_data)
+
+
+@extend_schema_view(
+    list=extend_schema(
+        examples=[map_example],
+    ),
+    get=map_schema,
+)
+class VehicleMapPyramidListView(VehicleMapLargeCountListView):
+    """List for map answered from precomputed cluster pyramid.
+
+    Pyramid is built by "build_cluster_pyramid" command.
+    Requests with filters that can't be served from the pyramid
+    fall back to the live clustering query.
+    """
+
+    # Filters which are stored as pyramid cell dimensions
+    pyramid_filters = ["vehicle_color"]
+
+    def get_pyramid_query(self):
+        return """
+            -- Cells completely inside the viewport are precomputed
+            WITH cells AS
+            (SELECT cell_x,
+                    cell_y,
+                    vehicles_count,
+                    lon_sum,
+                    lat_sum,
+                    vehicle_make,
+                    vehicle_color,
+                    creation_date,
+                    completion_date,
+                    type_of_service_request
+            FROM {table_name}
+            WHERE zoom = %(zoom)s
+                AND cell_x BETWEEN %(min_x)s AND %(max_x)s
+                AND cell_y BETWEEN %(min_y)s AND %(max_y)s
+                {color_condition}
+            UNION ALL
+            -- Edge cells are partially outside the viewport, so only vehicles in the viewport are taken
+            SELECT floor(ST_X(location) / %(cell_size)s)::integer AS cell_x,
+                floor(ST_Y(location) / %(cell_size)s)::integer AS cell_y,
+                1 AS vehicles_count,
+                ST_X(location) AS lon_sum,
+                ST_Y(location) AS lat_sum,
+                vehicle_make,
+                vehicle_color,
+                creation_date,
+                completion_date,
+                type_of_service_request
+            FROM {vehicle_table}
+            WHERE ({strips_condition})
+                AND NOT (
+                    floor(ST_X(location) / %(cell_size)s)::integer BETWEEN %(min_x)s AND %(max_x)s
+                    AND floor(ST_Y(location) / %(cell_size)s)::integer BETWEEN %(min_y)s AND %(max_y)s
+                )
+                {color_condition})
+            -- Merge cells for all stored vehicle colors and calculate cluster center
+            SELECT row_number() over(ORDER BY cell_x, cell_y) - 1 AS cluster,
+                sum(lon_sum) / sum(vehicles_count) AS lon,
+                sum(lat_sum) / sum(vehicles_count) AS lat,
+                sum(vehicles_count) AS vehicles_count,
+                CASE
+                    WHEN sum(vehicles_count) = 1 THEN max(vehicle_make)
+                    ELSE NULL
+                END AS vehicle_make,
+                CASE
+                    WHEN sum(vehicles_count) = 1 THEN max(vehicle_color)
+                    ELSE NULL
+                END AS vehicle_color,
+                CASE
+                    WHEN sum(vehicles_count) = 1 THEN max(creation_date)
+                    ELSE NULL
+                END AS creation_date,
+                CASE
+                    WHEN sum(vehicles_count) = 1 THEN max(completion_date)
+                    ELSE NULL
+                END AS completion_date,
+                CASE
+                    WHEN sum(vehicles_count) = 1 THEN max(type_of_service_request)
+                    ELSE NULL
+                END AS type_of_service_request
+            FROM cells
+            GROUP BY cell_x, cell_y
+        """
+
+    def get_pyramid_zoom(self):
+        """Get the largest precomputed cell which is not larger than cluster distance."""
+        if not self.max_distance_between_objects:
+            return None
+        zoom = math.ceil(math.log2(360 / self.max_distance_between_objects))
+        if zoom not in settings.MAP_PYRAMID_ZOOM_LEVELS:
+            return None
+        return zoom
+
+    def can_use_pyramid(self, zoom):
+        if zoom is None or self.has_filters(exclude=self.pyramid_filters):
+            return False
+        return VehicleClusterCell.objects.filter(zoom=zoom).exists()
+
+    def clusterize(self, queryset):
+        zoom = self.get_pyramid_zoom()
+        if not self.can_use_pyramid(zoom):
+            return super().clusterize(queryset)
+
+        self.engine = "postgis"
+        params, strips_condition = self.get_cells_split(
+            VehicleClusterCell.get_cell_size(zoom)
+        )
+        params["zoom"] = zoom
+        color_condition = ""
+        vehicle_color = self.request.query_params.get("vehicle_color")
+        if vehicle_color:
+            color_condition = "AND vehicle_color = %(vehicle_color)s"
+            params["vehicle_color"] = vehicle_color
+
+        pyramid_query = self.get_pyramid_query().format(
+            table_name=VehicleClusterCell._meta.db_table,
+            vehicle_table=Vehicle._meta.db_table,
+            strips_condition=strips_condition,
+            color_condition=color_condition,
+        )
+        return self.fetch_clusters(pyramid_query, params)
+
+
+class TileContentNegotiation(DefaultContentNegotiation):
+    """Map clients request tiles with protobuf "Accept" headers.
+
+    Tile itself is returned as raw response, so renderer is used for errors only.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class VehicleTileView(VehicleMapLargeCountListView):
+    """Mapbox Vector Tile with clusters.
+
+    For example,
+    http://localhost:8000/api/vehicles/tiles/12/1050/1522.mvt?vehicle_make__icontains=Bmw
+    """
+
+    content_negotiation_class = TileContentNegotiation
+
+    def set_map_options(self, request):
+        z, x, y = self.kwargs["z"], self.kwargs["x"], self.kwargs["y"]
+        if not 0 <= z <= settings.MAP_TILE_MAX_ZOOM:
+            raise ValidationError(
+                {"z": f"Integer from 0 to {settings.MAP_TILE_MAX_ZOOM} expected"}
+            )
+        if not (0 <= x < 2**z and 0 <= y < 2**z):
+            raise ValidationError(
+                {"detail": f"Tile x and y must be from 0 to {2**z - 1} for zoom {z}"}
+            )
+        self.set_bbox(*tile_bounds(z, x, y))
+
+    def get_tile_query(self):
+        return """
+            WITH clusters AS ({map_query}),
+            -- Convert cluster centers to the tile coordinate space
+                tile_clusters AS
+            (SELECT ST_AsMVTGeom(
+                        ST_Transform(ST_SetSRID(ST_MakePoint(lon, lat), 4326), 3857),
+                        ST_TileEnvelope({z}, {x}, {y}),
+                        {extent},
+                        {buffer},
+                        true
+                    ) AS geom,
+                    cluster,
+                    vehicles_count,
+                    vehicle_make,
+                    vehicle_color,
+                    creation_date::text AS creation_date,
+                    completion_date::text AS completion_date,
+                    type_of_service_request
+            FROM clusters)
+            SELECT ST_AsMVT(tile_clusters.*, 'vehicles', {extent}, 'geom')
+            FROM tile_clusters
+        """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        # Tile query is already grid + DBSCAN, so the guard can only reject it
+        self.check_query_cost(queryset)
+        map_query, params = self.get_map_sql(queryset)
+        tile_query = self.get_tile_query().format(
+            map_query=map_query,
+            z=self.kwargs["z"],
+            x=self.kwargs["x"],
+            y=self.kwargs["y"],
+            extent=settings.MAP_TILE_EXTENT,
+            buffer=settings.MAP_TILE_BUFFER,
+        )
+        _, rows = self.execute_map_query(tile_query, params)
+        tile = rows[0][0]
+        response = HttpResponse(
+            bytes(tile or b""),
+            content_type="application/vnd.mapbox-vector-tile",
+        )
+        patch_cache_control(response, public=True, max_age=settings.MAP_TILE_MAX_AGE)
+        return response
+
+
+@extend_schema_view(
+    list=extend_schema(
+        examples=[map_example],
+    ),
+    get=map_schema,
+)
+class VehicleMapAutoListView(VehicleMapListView):
+    """List for map with clustering strategy selected by estimated vehicles count.
+
+    Raw points for small count, DBSCAN for medium and grid + DBSCAN for large count.
+    Selected strategy is returned in "X-Map-Strategy" header,
+    it is replaced with backend name when clusters are built in the web worker.
+    """
+
+    strategy = None
+    # Strategy is replaced with "grid" by the cost guard
+    cached_state_fields = VehicleMapListView.cached_state_fields + ["strategy"]
+
+    def get_points_query(self):
+        return """
+            -- Every vehicle is a cluster with one item
+            SELECT row_number() over() - 1 AS cluster,
+                ST_X(location) AS lon,
+                ST_Y(location) AS lat,
+                1 AS vehicles_count,
+                vehicle_make,
+                vehicle_color,
+                creation_date,
+                completion_date,
+                type_of_service_request
+            FROM ({sql}) q1
+        """
+
+    def get_strategy(self, queryset):
+        estimated_count = self.get_estimated_count(queryset)
+        thresholds = settings.MAP_AUTO_STRATEGY_THRESHOLDS
+        if estimated_count <= thresholds["points"]:
+            return "points"
+        if estimated_count <= thresholds["dbscan"]:
+            return "dbscan"
+        return "grid"
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        self.strategy = self.get_strategy(queryset)
+        return queryset
+
+    def check_query_cost(self, queryset):
+        super().check_query_cost(queryset)
+        if self.downgraded:
+            self.strategy = "grid"
+
+    def get_map_query(self):
+        if self.strategy == "points":
+            return self.get_points_query()
+        if self.strategy == "dbscan":
+            return VehicleMapListView.get_map_query(self)
+        return VehicleMapLargeCountListView.get_map_query(self)
+
+    def get_cache_params(self):
+        params = super().get_cache_params()
+        params["strategy"] = self.strategy
+        return params
+
+    def get_map_headers(self, cache_status):
+        headers = super().get_map_headers(cache_status)
+        # Web worker backends don't run strategy queries
+        if self.engine in ("numpy", "parallel"):
+            headers["X-Map-Strategy"] = self.engine
+        else:
+            headers["X-Map-Strategy"] = self.strategy
+        return headers
+
+
+@extend_schema_view(
+    list=extend_schema(
+        examples=[map_example],
+    ),
+    get=map_schema,
+)
+class VehicleMapGeohashListView(VehicleMapListView):
+    """List for map with clusters by geohash prefix.
+
+    Geohash prefix length is selected by the viewport size,
+    cluster ids are stable across map pans.
+    """
+
+    # Grouping by geohash prefix is cheap even for large viewports
+    cost_guard_downgrade = False
+
+    def get_map_query(self):
+        return """
+            -- Group vehicles by geohash prefix, which is a grid cell
+            SELECT left(geohash, {self.geohash_precision}) AS cluster,
+                avg(ST_X(location)) as lon,
+                avg(ST_Y(location)) as lat,
+                count(*) AS vehicles_count,
+                CASE
+                    WHEN count(*) = 1 THEN max(vehicle_make)
+                    ELSE NULL
+                END AS vehicle_make,
+                CASE
+                    WHEN count(*) = 1 THEN max(vehicle_color)
+                    ELSE NULL
+                END AS vehicle_color,
+                CASE
+                    WHEN count(*) = 1 THEN max(creation_date)
+                    ELSE NULL
+                END AS creation_date,
+                CASE
+                    WHEN count(*) = 1 THEN max(completion_date)
+                    ELSE NULL
+                END AS completion_date,
+                CASE
+                    WHEN count(*) = 1 THEN max(type_of_service_request)
+                    ELSE NULL
+                END AS type_of_service_request
+            FROM ({sql}) q1
+            GROUP BY 1
+        """
+
+    @property
+    def geohash_precision(self):
+        """The shortest prefix with cell not larger than distance between clusters."""
+        for precision in range(1, GEOHASH_MAX_PRECISION + 1):
+            if max(geohash_cell_size(precision)) <= self.max_distance_between_objects:
+                return precision
+        return GEOHASH_MAX_PRECISION
+
+    def get_queryset(self):
+        # Geohash is empty for rows which aren't backfilled yet
+        queryset = super().get_queryset().filter(geohash__isnull=False)
+        # Common prefix of viewport corners allows btree range scan over geohash index
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        prefix = os.path.commonprefix(
+            [
+                encode_geohash(max(min_lon, -180), max(min_lat, -90), 12),
+                encode_geohash(min(max_lon, 180), min(max_lat, 90), 12),
+            ]
+        )
+        if prefix:
+            queryset = queryset.filter(geohash__startswith=prefix)
+        return queryset
+
+    def get_map_sql(self, queryset):
+        query = queryset.values(
+            "geohash",
+            "location",
+            "vehicle_color",
+            "vehicle_make",
+            "creation_date",
+            "completion_date",
+            "type_of_service_request",
+        ).query
+        sql, params = query.sql_with_params()
+        return self.get_map_query().format(sql=sql, self=self), params
+
+    def fetch_clusters(self, map_query, params):
+        data = super().fetch_clusters(map_query, params)
+        for data_item in data:
+            data_item["cluster"] = geohash_to_int(data_item["cluster"])
+        return data